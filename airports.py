@@ -0,0 +1,90 @@
+"""Compact airport index used by the search form.
+
+The index is a gzipped TSV of (IATA, city, name) rows, sorted by label. It is
+shipped in data/ and rebuilt from the airportsdata dataset (MIT licensed) with
+
+    python airports.py                 # downloads airports.csv
+    python airports.py airports.csv    # or reads a local copy
+"""
+import csv
+import gzip
+import io
+import os
+import sys
+import urllib.request
+
+AIRPORTS_URL = "https://raw.githubusercontent.com/mborsetti/airportsdata/main/airportsdata/airports.csv"
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.tsv.gz")
+
+
+def airport_label(iata, city, name):
+    return f"{city} - {name} ({iata})"
+
+
+class AirportIndex:
+    __slots__ = ("iata", "labels", "_position", "_by_label")
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: airport_label(*row))
+        self.iata = tuple(row[0] for row in rows)
+        self.labels = tuple(airport_label(*row) for row in rows)
+        self._position = {code: i for i, code in enumerate(self.iata)}
+        self._by_label = dict(zip(self.labels, self.iata))
+
+    def __len__(self):
+        return len(self.iata)
+
+    def position(self, iata, default=0):
+        return self._position.get(iata, default)
+
+    def iata_for(self, label):
+        return self._by_label.get(label)
+
+    def label_for(self, iata):
+        i = self._position.get(iata)
+        return self.labels[i] if i is not None else None
+
+
+def parse_airports_csv(text):
+    rows = {}
+    for record in csv.DictReader(io.StringIO(text)):
+        iata = record.get("iata") or ""
+        # Most airports in the dataset only have an ICAO code
+        if len(iata) != 3 or not iata.isalpha() or iata in rows:
+            continue
+        rows[iata] = (iata, record["city"] or record["name"], record["name"])
+    return list(rows.values())
+
+
+def write_index(rows, path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerows(sorted(rows, key=lambda row: airport_label(*row)))
+
+
+def read_index(path=INDEX_PATH):
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return [tuple(row) for row in csv.reader(f, delimiter="\t")]
+
+
+def download_airports(url=AIRPORTS_URL):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return parse_airports_csv(response.read().decode("utf-8"))
+
+
+def load_index(path=INDEX_PATH):
+    # The shipped index avoids the network entirely. Without it the dataset is
+    # downloaded but kept in memory, since the app directory may be read-only.
+    rows = read_index(path) if os.path.exists(path) else download_airports()
+    return AirportIndex(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            rows = parse_airports_csv(f.read())
+    else:
+        rows = download_airports()
+    write_index(rows)
+    print(f"Wrote {len(rows)} airports to {INDEX_PATH}")
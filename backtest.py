@@ -0,0 +1,221 @@
+"""Replay recorded flight_prices observations against a grid of hypothetical alerts.
+
+    python backtest.py --targets 150:400:10 --layovers 0 1 2 --carriers Any "Delta,United"
+    python backtest.py --input flight_prices.csv --route "JFK - LAX" --output grid.csv
+
+Observations are grouped into series, one per route and departure date. A
+hypothetical alert watches every series from its first observation and fires
+at the first observation with a fare it accepts, using the rules of
+matching.match_alerts: at most `max_layovers` stops, an airline among its
+carriers unless it has none, and a price at or below the target once both are
+in the same currency.
+
+Each (max_layovers, carriers) filter takes one pass over the observations: a
+per-series running minimum, reduced to the points where it drops. Each drop
+fires a contiguous range of the sorted targets, so per-target counts and means
+come from prefix sums and medians (to the day) from per-target histograms.
+"""
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from fx import CANONICAL_CURRENCY, current_rates
+from history import TIMESTAMP_FORMAT
+from matching import carrier_filter, conversion_factors
+
+DAY = 86400
+
+
+def _seconds(values, fmt=None):
+    """Epoch seconds of datetime strings and a mask of the unparseable ones, parsing each distinct value once."""
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Index(uniques).astype(str)
+    parsed = pd.to_datetime(uniques, format=fmt, errors="coerce")
+    if parsed.isna().any():
+        parsed = parsed.where(parsed.notna(), pd.to_datetime(uniques, format="mixed", errors="coerce"))
+    seconds = np.append(parsed.values.astype("datetime64[s]").astype(np.int64), 0)
+    invalid = np.append(parsed.isna(), True)
+    # factorize codes missing values as -1, which picks the appended placeholder
+    return seconds[codes], invalid[codes]
+
+
+def _interval_sum(lo, hi, values, size):
+    """Sum over target indices of `values` each applying to targets [lo, hi)."""
+    diff = np.bincount(lo, values, minlength=size + 1) - np.bincount(hi, values, minlength=size + 1)
+    return np.cumsum(diff)[:size]
+
+
+def _interval_median(lo, hi, values, size):
+    """Lower median per target index of whole-day `values` each applying to targets [lo, hi)."""
+    days = np.clip(np.floor(values), 0, None).astype(np.int64)
+    bins = int(days.max()) + 1 if len(days) else 1
+    diff = (np.bincount(lo * bins + days, minlength=(size + 1) * bins)
+            - np.bincount(hi * bins + days, minlength=(size + 1) * bins))
+    histogram = np.cumsum(diff.reshape(size + 1, bins)[:size], axis=0)
+    cumulative = np.cumsum(histogram, axis=1)
+    total = cumulative[:, -1]
+    median = np.argmax(cumulative >= ((total + 1) // 2)[:, None], axis=1).astype(float)
+    return np.where(total > 0, median, np.nan)
+
+
+class Replay:
+    """Observations prepared for replay: sorted by series and time, priced in `currency`."""
+
+    def __init__(self, observations, currency=CANONICAL_CURRENCY, rates=None):
+        frame = observations.dropna(subset=["price", "layovers", "timestamp", "departure_time"])
+        self.currency = currency
+
+        currency_codes, fare_currencies = pd.factorize(frame["currency"].fillna(currency))
+        factors = np.asarray(conversion_factors([(currency, fare) for fare in fare_currencies], rates), dtype=float)
+        price = frame["price"].to_numpy(dtype=float) / factors[currency_codes]
+        observed, bad_time = _seconds(frame["timestamp"], TIMESTAMP_FORMAT)
+
+        # String columns are factorized once and only their distinct values parsed
+        departure_codes, departures = pd.factorize(frame["departure_time"])
+        date_codes, date_names = pd.factorize(pd.Index(departures).astype(str).str[:10])
+        date_codes = date_codes[departure_codes]
+        date_seconds, bad_dates = _seconds(date_names, "%Y-%m-%d")
+        route_codes, route_names = pd.factorize(frame["origin_to_destination"])
+        airline_codes, airlines = pd.factorize(frame["airline"])
+        self.airlines = pd.Index(airlines)
+
+        keep = ~(np.isnan(price) | bad_time | bad_dates[date_codes])
+        series, series_keys = pd.factorize(route_codes[keep].astype(np.int64) * len(date_names) + date_codes[keep])
+        observed = observed[keep]
+        order = np.argsort(series * (observed.max() - observed.min() + 1) + (observed - observed.min()), kind="stable") \
+            if len(series) else np.zeros(0, dtype=np.int64)
+        self.series = series[order]
+        self.observed = observed[order]
+        self.price = price[keep][order]
+        self.layovers = frame["layovers"].to_numpy(dtype=np.int64)[keep][order]
+        self.airline = airline_codes[keep][order]
+
+        # Per-series first observation, travel date and label, indexed by series code
+        firsts = np.r_[True, self.series[1:] != self.series[:-1]] if len(self.series) else np.zeros(0, dtype=bool)
+        self.start = self.observed[firsts]
+        self.travel = date_seconds[series_keys % len(date_names)]
+        self.labels = pd.DataFrame({
+            "route": np.asarray(route_names)[series_keys // len(date_names)],
+            "travel_date": np.asarray(date_names)[series_keys % len(date_names)],
+        })
+
+    def __len__(self):
+        return len(self.price)
+
+    @property
+    def series_count(self):
+        return len(self.labels)
+
+    def _drops(self, max_layovers, carriers):
+        """(series, time, price, previous price) at each point where a series' cheapest
+        accepted fare so far drops; the previous price is inf at a series' first drop."""
+        mask = self.layovers <= max_layovers
+        if carriers is not None:
+            codes = self.airlines.get_indexer(list(carriers))
+            mask &= np.isin(self.airline, codes[codes >= 0])
+        series, observed, price = self.series[mask], self.observed[mask], self.price[mask]
+        if not len(series):
+            return series, observed, price, price
+        running = pd.Series(price).groupby(series, sort=False).cummin().to_numpy()
+        first = np.r_[True, series[1:] != series[:-1]]
+        drops = first | np.r_[True, running[1:] < running[:-1]]
+        level = running[drops]
+        previous = np.where(first[drops], np.inf, np.r_[np.inf, level[:-1]])
+        return series[drops], observed[drops], level, previous
+
+    def evaluate(self, targets, max_layovers, carriers=None):
+        """One summary row per target, in ascending order, for alerts with these filters.
+
+        A drop to price p fires every alert whose target is at least p but below
+        the series' previous cheapest fare, so each drop covers one contiguous
+        range of the sorted targets and no (series x target) matrix is built.
+        """
+        targets = np.unique(np.asarray(targets, dtype=float))
+        series, observed, level, previous = self._drops(max_layovers, carriers)
+        lo = np.searchsorted(targets, level)
+        hi = np.searchsorted(targets, previous)
+        lead = (self.travel[series] - observed) / DAY
+        wait = (observed - self.start[series]) / DAY
+
+        size = len(targets)
+        fired = _interval_sum(lo, hi, np.ones(len(lo)), size).round().astype(np.int64)
+        total = self.series_count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "target_price": targets,
+                "max_layovers": max_layovers,
+                "preferred_carriers": ",".join(carriers) if carriers else "Any",
+                "series": total,
+                "fired": fired,
+                "fire_rate": fired / total if total else np.nan,
+                "median_lead_days": _interval_median(lo, hi, lead, size),
+                "mean_lead_days": np.where(fired > 0, _interval_sum(lo, hi, lead, size) / fired, np.nan),
+                "median_wait_days": _interval_median(lo, hi, wait, size),
+            })
+
+
+def backtest(observations, targets, layovers=(0, 1, 2), carrier_sets=(None,), currency=CANONICAL_CURRENCY, rates=None):
+    """Summary of every (target, max_layovers, carriers) alert over the observations.
+
+    `fire_rate` is the share of series in which the alert would have fired,
+    `median_lead_days` how long before departure and `median_wait_days` how
+    long after the series' first observation.
+    """
+    replay = Replay(observations, currency, rates)
+    grid = [
+        replay.evaluate(targets, max_layovers, carrier_filter(carriers))
+        for max_layovers in layovers
+        for carriers in carrier_sets
+    ]
+    return pd.concat(grid, ignore_index=True)
+
+
+def parse_targets(values):
+    """Target prices from numbers and inclusive "start:stop:step" ranges."""
+    targets = []
+    for value in values:
+        if ":" in value:
+            start, stop, step = (float(part) for part in value.split(":"))
+            targets += list(np.arange(start, stop + step / 2, step))
+        else:
+            targets.append(float(value))
+    return np.unique(np.round(targets, 2))
+
+
+def _carrier_set(value):
+    return None if value == "Any" else [carrier.strip() for carrier in value.split(",") if carrier.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="CSV export of flight_prices; read from the configured storage otherwise")
+    parser.add_argument("--since", default=(date.today() - timedelta(days=90)).isoformat(),
+                        help="first observation date to replay (default: 90 days ago)")
+    parser.add_argument("--route", action="append", help='route such as "JFK - LAX"; repeat for more')
+    parser.add_argument("--currency", default=CANONICAL_CURRENCY)
+    parser.add_argument("--targets", nargs="+", default=["50:1500:25"], help='prices and "start:stop:step" ranges')
+    parser.add_argument("--layovers", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--carriers", nargs="+", default=["Any"], help='"Any" or comma-separated airlines, per set')
+    parser.add_argument("--output", help="write the full grid to this CSV file")
+    args = parser.parse_args()
+
+    if args.input:
+        observations = pd.read_csv(args.input)
+        # timestamps start with the date, so the date bound compares correctly as text
+        observations = observations[observations["timestamp"].astype(str) >= args.since]
+        if args.route:
+            observations = observations[observations["origin_to_destination"].isin(args.route)]
+    else:
+        from load import load_price_observations
+        observations = load_price_observations(args.since, args.route)
+    print(f"Replaying {len(observations)} observations")
+
+    grid = backtest(observations, parse_targets(args.targets), args.layovers,
+                    [_carrier_set(value) for value in args.carriers], args.currency, current_rates())
+    if args.output:
+        grid.to_csv(args.output, index=False)
+        print(f"Wrote {len(grid)} alert configurations to {args.output}")
+    with pd.option_context("display.max_rows", 40, "display.width", 160):
+        print(grid.round(2).to_string(index=False, max_rows=40))
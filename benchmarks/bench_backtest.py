@@ -0,0 +1,88 @@
+"""Throughput of backtest.py on synthetic flight_prices observations.
+
+    python benchmarks/bench_backtest.py
+    python benchmarks/bench_backtest.py --observations 5000000 --targets 2000 --json
+
+Observations are generated in memory with the columns and timestamp format
+the pipeline writes, so the timings cover parsing as well as the replay.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backtest
+from fx import read_rates
+
+
+def synthetic_observations(count, series, fares_per_search=20, seed=0):
+    rng = np.random.default_rng(seed)
+    searches = max(1, count // fares_per_search)
+    search_series = rng.integers(0, series, searches)
+    start = np.datetime64("2026-01-01T00:00")
+    observed = start + rng.integers(0, 90 * 24 * 60, searches).astype("timedelta64[m]")
+    stamps = pd.to_datetime(observed).strftime("%Y-%m-%d %I:%M:%S %p").to_numpy()
+    routes = np.array([f"R{route:03d} - D{route % 7}" for route in range(max(1, series // 60))])
+    travel = (np.datetime64("2026-04-01") + np.arange(60)).astype(str)
+
+    rows = np.repeat(np.arange(searches), fares_per_search)[:count]
+    fare_series = search_series[rows]
+    return pd.DataFrame({
+        "origin_to_destination": routes[fare_series // 60 % len(routes)],
+        "departure_time": np.char.add(travel[fare_series % 60], " 08:00"),
+        "airline": np.array(["Delta", "United", "Alaska", "JetBlue", "American"])[rng.integers(0, 5, len(rows))],
+        "layovers": rng.integers(0, 3, len(rows)),
+        "price": np.round(rng.lognormal(5.8, 0.35, len(rows)), 2),
+        "currency": np.where(rng.random(len(rows)) < 0.1, "EUR", "USD"),
+        "timestamp": stamps[rows],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--observations", type=int, default=2_000_000)
+    parser.add_argument("--series", type=int, default=20_000, help="route and travel date combinations")
+    parser.add_argument("--targets", type=int, default=1000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    observations = synthetic_observations(args.observations, args.series)
+    targets = np.linspace(100, 1500, args.targets)
+    layovers = [0, 1, 2]
+    carrier_sets = [None, ["Delta"], ["United", "American"]]
+    rates = read_rates()
+
+    started = time.perf_counter()
+    replay = backtest.Replay(observations, "USD", rates)
+    prepared = time.perf_counter()
+    grid = pd.concat([
+        replay.evaluate(targets, max_layovers, carriers)
+        for max_layovers in layovers for carriers in carrier_sets
+    ], ignore_index=True)
+    finished = time.perf_counter()
+
+    report = {
+        "observations": len(replay),
+        "series": replay.series_count,
+        "configs": len(grid),
+        "prepare_s": round(prepared - started, 3),
+        "evaluate_s": round(finished - prepared, 3),
+        "total_s": round(finished - started, 3),
+        "config_observations_per_s": round(len(grid) * len(replay) / (finished - started)),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['observations']} observations, {report['series']} series, {report['configs']} alert configs: "
+              f"prepare {report['prepare_s']}s, evaluate {report['evaluate_s']}s, total {report['total_s']}s")
+
+
+if __name__ == "__main__":
+    main()
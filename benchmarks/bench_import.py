@@ -0,0 +1,84 @@
+"""Cold-start import cost of the scheduler and shared modules, from `python -X importtime`.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --module scheduler --top 20 --json
+
+Each module is imported in a fresh interpreter --repeat times; the median total
+and the slowest top-level dependencies are reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies the scheduler should not pay for at import time
+HEAVY = ["streamlit", "plotly", "supabase", "twilio", "requests"]
+
+
+def import_profile(module):
+    """(total microseconds, {top-level package: cumulative us}, loaded heavy modules) for one cold import."""
+    probe = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    # The SQLite backend keeps the probe from needing Supabase credentials
+    env.setdefault("STORAGE_BACKEND", "sqlite")
+    env.setdefault("SQLITE_PATH", os.path.join(ROOT, "bench_import.db"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    total = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            us = int(cumulative)
+        except ValueError:
+            continue  # header line
+        name = name.strip()
+        if name == module:
+            total = us
+            continue
+        # A package is charged once, at the line of its first (outermost) import
+        root = name.split(".")[0]
+        packages[root] = max(packages.get(root, 0), us)
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return total, packages, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", action="append", help="module to import (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for module in args.module or ["scheduler", "load", "extractor", "notifications"]:
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        totals = [total for total, _, _ in runs]
+        _, packages, loaded = runs[totals.index(sorted(totals)[len(totals) // 2])]
+        report[module] = {
+            "median_ms": statistics.median(totals) / 1000,
+            "min_ms": min(totals) / 1000,
+            "heavy_loaded": loaded,
+            "top": {name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]},
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for module, stats in report.items():
+        heavy = ", ".join(stats["heavy_loaded"]) or "none"
+        print(f"{module:<14} median {stats['median_ms']:8.1f}ms  min {stats['min_ms']:8.1f}ms  heavy: {heavy}")
+        for name, ms in stats["top"].items():
+            print(f"    {name:<40} {ms:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Rows/sec of load_flights against a local stand-in for the Supabase client,
+or against the SQLite backend.
+
+    python benchmarks/bench_load.py --rows 500 --latency-ms 20
+    python benchmarks/bench_load.py --backend sqlite --rows 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+# Only flight_prices writes are measured; the stand-in does not serve the rollup reads
+os.environ.setdefault("HISTORY_ROLLUPS", "False")
+
+import pandas as pd
+
+import load
+from storage import SQLiteStorage, SupabaseStorage
+
+
+class StandInTable:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self._rows = None
+
+    def insert(self, rows):
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        # One HTTP round-trip plus a small per-row serialization cost
+        time.sleep(self.backend.latency + self.backend.per_row * len(self._rows))
+        self.backend.requests += 1
+        self.backend.rows.setdefault(self.name, []).extend(self._rows)
+        return self
+
+
+class StandInBackend:
+    def __init__(self, latency, per_row):
+        self.latency = latency
+        self.per_row = per_row
+        self.requests = 0
+        self.rows = {}
+
+    def table(self, name):
+        return StandInTable(self, name)
+
+
+def sample_frame(n):
+    return pd.DataFrame({
+        "airline": ["Alaska", "Delta", "United", "Southwest"] * (n // 4) + ["Alaska"] * (n % 4),
+        "price": [float(100 + i % 400) for i in range(n)],
+        "currency": "USD",
+        "duration_min": 125,
+        "layovers": [i % 3 for i in range(n)],
+        "layover_info": "None",
+        "origin_to_destination": "SEA - SJC",
+        "departure_time": "2026-12-10 06:05",
+        "arrival_time": "2026-12-10 08:40",
+        "timestamp": "2026-10-18 09:00:00 AM",
+    })
+
+
+def per_row_insert(df):
+    # The previous implementation: one request per record
+    for record in df.to_dict(orient="records"):
+        load.storage.insert_rows("flight_prices", [record])
+
+
+def measure(label, fn, df, requests=None):
+    start = time.perf_counter()
+    fn(df)
+    elapsed = time.perf_counter() - start
+    count = requests() if requests else "-"
+    print(f"{label:<22} {len(df):>7} rows  {count:>5} requests  {elapsed:8.3f}s  {len(df) / elapsed:>10.0f} rows/s")
+    return len(df) / elapsed
+
+
+def bench_sqlite(df, chunk_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, fn in [
+            ("per-row (before)", per_row_insert),
+            ("chunked", lambda frame: load.load_flights(frame, chunk_size=chunk_size)),
+        ]:
+            load.storage = SQLiteStorage(os.path.join(tmp, f"{len(results)}.db"))
+            results[label] = measure(f"sqlite {label}", fn, df)
+    print(f"speedup: {results['chunked'] / results['per-row (before)']:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=["standin", "sqlite"], default="standin")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=load.FLIGHTS_CHUNK_SIZE)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-row-us", type=float, default=5.0)
+    args = parser.parse_args()
+
+    df = sample_frame(args.rows)
+    if args.backend == "sqlite":
+        bench_sqlite(df, args.chunk_size)
+        return
+
+    results = {}
+    for label, fn in [
+        ("per-row (before)", per_row_insert),
+        ("chunked", lambda frame: load.load_flights(frame, chunk_size=args.chunk_size)),
+    ]:
+        backend = StandInBackend(args.latency_ms / 1000, args.per_row_us / 1e6)
+        load.storage = SupabaseStorage(backend)
+        results[label] = measure(label, fn, df, lambda: backend.requests)
+
+    backend = StandInBackend(args.latency_ms / 1000, args.per_row_us / 1e6)
+    load.storage = SupabaseStorage(backend)
+    start = time.perf_counter()
+    load.load_flights(df, chunk_size=args.chunk_size, background=True)
+    blocked = time.perf_counter() - start
+    load.flight_writer.flush()
+    print(f"{'background':<22} {len(df):>7} rows  {backend.requests:>5} requests  caller blocked {blocked * 1000:.2f}ms")
+    print(f"speedup: {results['chunked'] / results['per-row (before)']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""End-to-end benchmark of extract -> transform -> load -> notify on recorded payloads.
+
+Nothing leaves the machine: searches go through the real upstream client to
+the local SerpAPI stand-in (benchmarks/serpapi_standin.py), which answers with
+the recorded google_flights payloads in benchmarks/fixtures; flight rows go to
+a temporary SQLite database, emails to a local SMTP sink and SMS to an
+in-process sink.
+
+    python benchmarks/bench_pipeline.py --alerts 10 100 1000 10000
+    python benchmarks/bench_pipeline.py --alerts 100000 --mode scheduler --output after.json
+    python benchmarks/bench_pipeline.py --alerts 1000 --compare before.json
+    python benchmarks/bench_pipeline.py --alerts 1000 --latency-ms 200 --error-rate 0.05 --throttle-rate 0.02
+
+`--mode stages` times every stage call and reports throughput, p50/p95/p99
+latency and peak traced memory per stage; `--mode scheduler` runs scheduler.run
+over the same alerts and reports the whole run.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from serpapi_standin import start_standin
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.sendmail; messages are counted and dropped."""
+
+    def handle(self):
+        self.wfile.write(b"220 sink\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"DATA":
+                self.wfile.write(b"354 end with .\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.wfile.write(b"250 queued\r\n")
+            elif verb == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+def start_smtp_sink():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPSink)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.messages = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SMSSink:
+    """Stands in for twilio.rest.Client."""
+
+    def __init__(self):
+        self.messages = self
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def create(self, body, from_, to):
+        with self._lock:
+            self.sent += 1
+
+
+class Stage:
+    def __init__(self, name, memory):
+        self.name = name
+        self.memory = memory
+        self.samples = []
+        self.items = 0
+        self.peak = 0
+
+    def run(self, fn, *args, items=1, **kwargs):
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.append(time.perf_counter() - start)
+        self.items += items
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        return result
+
+    def summary(self):
+        if not self.samples:
+            return {"calls": 0}
+        samples = np.asarray(self.samples)
+        total = float(samples.sum())
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {
+            "calls": len(samples),
+            "items": self.items,
+            "total_s": round(total, 4),
+            "calls_per_s": round(len(samples) / total, 1) if total else None,
+            "items_per_s": round(self.items / total, 1) if total else None,
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "peak_kb": round(self.peak / 1024, 1) if self.memory else None,
+        }
+
+
+def synthetic_alerts(count, alerts_per_route, trigger_ratio, seed=0):
+    r = random.Random(seed)
+    routes = max(1, math.ceil(count / alerts_per_route))
+    alerts = []
+    for i in range(count):
+        route = i % routes
+        alerts.append({
+            "origin": f"A{route // 26:02d}"[:3],
+            "destination": "Z" + chr(ord("A") + route % 26) + chr(ord("A") + route // 26 % 26),
+            "date_from": "2026-12-10",
+            "date_to": None,
+            "trip_type": "One-Way",
+            "currency": "USD",
+            "max_layovers": r.randint(0, 2),
+            "preferred_carriers": None,
+            # Either below every fare or above every fare, so the trigger ratio is exact
+            "target_price": 100000.0 if r.random() < trigger_ratio else 1.0,
+            "user_email": f"user{i}@example.com",
+            "user_phone": f"+1555{i:07d}",
+            "route": route,
+        })
+    return routes, alerts
+
+
+def run_stages(alerts, routes, memory):
+    import load
+    from extractor import extract_flights
+    from notifications import check_alert
+    from itinerary import to_records
+
+    stages = {name: Stage(name, memory) for name in ["extract", "transform", "load", "notify"]}
+    by_route = [[] for _ in range(routes)]
+    for alert in alerts:
+        by_route[alert["route"]].append(alert)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for members in by_route:
+            first = members[0]
+            flights, insights, booking_link, generic_link = stages["extract"].run(
+                extract_flights, first["origin"], first["destination"], first["date_from"], None,
+                max(a["max_layovers"] for a in members), False, "USD",
+            )
+            records = stages["transform"].run(to_records, flights, items=len(flights))
+            stages["load"].run(load.load_flight_records, records, items=len(records))
+            for alert in members:
+                stages["notify"].run(
+                    check_alert, flights, alert["target_price"], alert["currency"], booking_link, generic_link,
+                    alert["user_email"], alert["user_phone"],
+                )
+    return {name: stage.summary() for name, stage in stages.items()}
+
+
+def run_scheduler(alerts):
+    import load
+    import scheduler
+
+    rows = [load._normalize_alert({k: v for k, v in alert.items() if k != "route"}) for alert in alerts]
+    for start in range(0, len(rows), 1000):
+        load.get_storage().upsert_alerts(rows[start:start + 1000])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        scheduler.run()
+    return {}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {w["alerts"]: w for w in json.load(f)["workloads"]}
+    print(f"\ncompared with {baseline_path} (ratio = now / before)")
+    for workload in report["workloads"]:
+        before = baseline.get(workload["alerts"])
+        if before is None or before["mode"] != workload["mode"]:
+            continue
+        print(f"{workload['alerts']:>7} alerts  wall {workload['wall_s'] / before['wall_s']:.2f}x")
+        for name, stats in workload["stages"].items():
+            old = before["stages"].get(name)
+            if not old or not old.get("calls") or not stats.get("calls"):
+                continue
+            print(f"    {name:<10} p50 {stats['p50_ms'] / old['p50_ms']:.2f}x  p95 {stats['p95_ms'] / old['p95_ms']:.2f}x"
+                  f"  throughput {stats['items_per_s'] / old['items_per_s']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--mode", choices=["stages", "scheduler"], default="stages")
+    parser.add_argument("--alerts-per-route", type=int, default=10)
+    parser.add_argument("--trigger-ratio", type=float, default=0.05)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated SerpAPI latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of searches answered with a 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of searches answered with a 429")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows every stage")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="print the JSON report")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    smtp = start_smtp_sink()
+    sms = SMSSink()
+    standin = start_standin(latency=args.latency_ms / 1000, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate)
+    # Set before the pipeline modules are imported, since they read it at import time
+    os.environ.update(
+        SERPAPI_KEY="standin", SERPAPI_BASE_URL=standin.base_url, SERPAPI_CACHE_TTL="0", SERPAPI_RATE_PER_SEC="0",
+        STORAGE_BACKEND="sqlite", SET_EMAIL_ALERT="True", SET_SMS_ALERT="True",
+        EMAIL_SENDER="bench@example.com", EMAIL_APP_PASSWORD="", TWILIO_FROM_NUMBER="+15550000000",
+        SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp.server_address[1]), SMTP_STARTTLS="False",
+    )
+
+    import load
+    import metrics
+    import notifications
+    from storage import SQLiteStorage
+
+    notifications._twilio_client = lambda: sms
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "workloads": [],
+    }
+    # SQLite files of the workloads, removed once all have run
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp:
+        for count in args.alerts:
+            routes, alerts = synthetic_alerts(count, args.alerts_per_route, args.trigger_ratio)
+            load.storage = SQLiteStorage(os.path.join(tmp, f"{args.mode}_{count}.db"))
+            calls, emails, texts = standin.counts["requests"], smtp.messages, sms.sent
+            metrics.reset()
+            memory = not args.no_memory
+            if memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            stages = run_stages(alerts, routes, memory) if args.mode == "stages" else run_scheduler(alerts)
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if memory else None
+            if memory:
+                tracemalloc.stop()
+            workload = {
+                "mode": args.mode,
+                "alerts": count,
+                "routes": routes,
+                "wall_s": round(wall, 3),
+                "alerts_per_s": round(count / wall, 1),
+                "peak_mb": round(peak / 1e6, 2) if peak is not None else None,
+                "searches": standin.counts["requests"] - calls,
+                "emails": smtp.messages - emails,
+                "sms": sms.sent - texts,
+                "stages": stages,
+                "metrics": metrics.summary(),
+            }
+            report["workloads"].append(workload)
+
+            if not args.json:
+                peak_text = f"{workload['peak_mb']:.1f}MB" if peak is not None else "n/a"
+                print(f"{count:>7} alerts {routes:>6} routes  {wall:8.2f}s  {workload['alerts_per_s']:>9.1f} alerts/s  "
+                      f"peak {peak_text}  searches {workload['searches']}  emails {workload['emails']}  sms {workload['sms']}")
+                for name, stats in stages.items():
+                    if stats.get("calls"):
+                        print(f"    {name:<10} {stats['items_per_s']:>10.1f} items/s  p50 {stats['p50_ms']:7.3f}ms  "
+                              f"p95 {stats['p95_ms']:7.3f}ms  p99 {stats['p99_ms']:7.3f}ms  peak {stats['peak_kb'] or 0:.0f}KB")
+
+    smtp.shutdown()
+    standin.shutdown()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Micro-benchmark of transform_flights on a recorded google_flights payload.
+
+The records column times parsing into itinerary records alone, which is all
+the scheduler does; frame adds the DataFrame the UI displays.
+
+    python benchmarks/bench_transform.py --scale 50
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import transformer
+from itinerary import COLUMNS, parse_itineraries
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_transform_flights(flights, currency="USD"):
+    # Row-at-a-time implementation kept as the reference for output and speed
+    rows = []
+    for flight in flights:
+        if not isinstance(flight, dict):
+            continue
+        price = flight.get("total_price") or flight.get("price") or None
+        legs = flight.get("flights") or []
+        if price is None or not legs:
+            continue
+
+        layover_details = []
+        if len(legs) > 1:
+            for i in range(len(legs)-1):
+                arrival_leg = legs[i]
+                next_leg = legs[i+1]
+                arrival_airport  = arrival_leg["arrival_airport"]["id"]
+                arrival_time = pd.to_datetime(arrival_leg["arrival_airport"]["time"])
+                departure_time = pd.to_datetime(next_leg["departure_airport"]["time"])
+                duration = departure_time - arrival_time
+                duration_str = f"{int(duration.total_seconds()//3600)}h {int((duration.total_seconds()%3600)//60)}m"
+                layover_details.append(f"{arrival_airport} ({duration_str})")
+
+        rows.append({
+            "airline": legs[0]["airline"],
+            "price": float(price),
+            "currency": currency,
+            "duration_min": flight.get("total_duration"),
+            "layovers": len(legs) - 1,
+            "layover_info": "; ".join(layover_details) if layover_details else "None",
+            "origin_to_destination": f"{legs[0]['departure_airport']['id']} - {legs[-1]['arrival_airport']['id']}",
+            "departure_time": legs[0]["departure_airport"]["time"],
+            "arrival_time": legs[-1]["arrival_airport"]["time"],
+            "timestamp": datetime.now().strftime("%Y-%m-%d %I:%M:%S %p")
+        })
+
+    return pd.DataFrame(rows, columns=COLUMNS).sort_values(by="price") if rows else pd.DataFrame(columns=COLUMNS)
+
+
+def load_payloads():
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "google_flights_*.json"))):
+        with open(path) as f:
+            results = json.load(f)
+        payloads.append(results.get("best_flights", []) + results.get("other_flights", []))
+    return payloads
+
+
+def check_identical(flights):
+    expected = legacy_transform_flights(flights).drop(columns="timestamp")
+    actual = transformer.transform_flights(flights).drop(columns="timestamp")
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=50, help="repeat each payload this many times")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for flights in load_payloads():
+        check_identical(flights)
+        check_identical(flights * args.scale)
+        for label, scale in [("single response", 1), (f"x{args.scale} responses", args.scale)]:
+            batch = flights * scale
+            timings = {}
+            for name, fn in [("legacy", legacy_transform_flights), ("frame", transformer.transform_flights),
+                             ("records", lambda flights: parse_itineraries(flights, "USD"))]:
+                timings[name] = min(timeit.repeat(lambda: fn(batch), number=1, repeat=args.repeat))
+            print(f"{label:<18} {len(batch):>6} itineraries  legacy {timings['legacy'] * 1000:8.2f}ms  "
+                  f"frame {timings['frame'] * 1000:8.2f}ms  records {timings['records'] * 1000:8.2f}ms  "
+                  f"{timings['legacy'] / timings['records']:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Local HTTP stand-in for the SerpAPI search endpoint.
+
+Answers GET /search with the recorded google_flights payloads in
+benchmarks/fixtures, with optional latency and injected failures, so the
+upstream client can be exercised without spending searches:
+
+    python benchmarks/serpapi_standin.py --port 8765 --latency-ms 300 --error-rate 0.1 --throttle-rate 0.05
+    SERPAPI_BASE_URL=http://127.0.0.1:8765 SERPAPI_KEY=standin python scheduler.py
+
+--error-rate answers 503, --throttle-rate answers 429 with Retry-After and
+--drop-rate closes the connection without answering. --outage makes every
+request fail with 503. Connections are kept alive, and the count of new
+connections shows how well the client reuses them.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        url = urlparse(self.path)
+        if url.path != "/search":
+            self._send(404, {"error": f"Unknown path {url.path}"})
+            return
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if server.latency:
+            time.sleep(server.latency)
+        roll = server.random()
+        if server.outage or roll < server.error_rate:
+            server.count("errors")
+            self._send(503, {"error": "Service temporarily unavailable"})
+        elif roll < server.error_rate + server.throttle_rate:
+            server.count("throttled")
+            self._send(429, {"error": "Too many requests"}, [("Retry-After", str(server.retry_after))])
+        elif roll < server.error_rate + server.throttle_rate + server.drop_rate:
+            server.count("dropped")
+            self.close_connection = True
+        elif not params.get("api_key"):
+            self._send(401, {"error": "Invalid API key."})
+        else:
+            server.count("answered")
+            key = (params.get("departure_id"), params.get("arrival_id"))
+            # Stable per route across processes, unlike hash()
+            index = sum(map(ord, "".join(filter(None, key)))) % len(server.payloads)
+            self._send(200, server.payloads[index])
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, payloads, latency=0.0, error_rate=0.0, throttle_rate=0.0, drop_rate=0.0,
+                 retry_after=1, outage=False, seed=0):
+        super().__init__(address, StandinHandler)
+        self.payloads = payloads
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.outage = outage
+        self.counts = {"connections": 0, "requests": 0, "answered": 0, "errors": 0, "throttled": 0, "dropped": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def load_payloads(path=FIXTURES):
+    payloads = []
+    for name in sorted(glob.glob(os.path.join(path, "*.json"))):
+        with open(name, encoding="utf-8") as f:
+            payloads.append(json.load(f))
+    return payloads
+
+
+def start_standin(port=0, **options):
+    """Serve on 127.0.0.1 from a background thread; returns the server."""
+    server = StandinServer(("127.0.0.1", port), load_payloads(), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--outage", action="store_true")
+    args = parser.parse_args()
+
+    server = StandinServer(
+        ("127.0.0.1", args.port), load_payloads(), latency=args.latency_ms / 1000, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, drop_rate=args.drop_rate, retry_after=args.retry_after, outage=args.outage,
+    )
+    print(f"Serving {len(server.payloads)} recorded payloads on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.counts)
+
+
+if __name__ == "__main__":
+    main()
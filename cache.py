@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Request params that do not change the upstream result.
+IGNORED_PARAMS = {"api_key", "no_cache"}
+
+
+def cache_key(params):
+    normalized = {
+        k: str(v).strip().upper() if k in ("departure_id", "arrival_id", "currency") else str(v)
+        for k, v in params.items()
+        if k not in IGNORED_PARAMS and v is not None
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed TTL cache for SerpAPI responses with LRU eviction and
+    single-flight de-duplication of concurrent identical requests."""
+
+    def __init__(self, path, ttl=900, max_entries=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT payload, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def get_or_fetch(self, params, fetch):
+        key = cache_key(params)
+        cached = self.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+        if not leader:
+            return pending.result()
+
+        try:
+            # Another leader may have filled the entry between our lookup and claim.
+            result = self.get(key)
+            if result is None:
+                result = fetch(params)
+                if "error" not in result:
+                    self.set(key, result)
+            pending.set_result(result)
+            return result
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+def cache_from_env():
+    ttl = int(os.getenv("SERPAPI_CACHE_TTL", "900"))
+    if ttl <= 0:
+        return None
+    return ResponseCache(
+        os.getenv("SERPAPI_CACHE_PATH", "serpapi_cache.db"),
+        ttl=ttl,
+        max_entries=int(os.getenv("SERPAPI_CACHE_MAX_ENTRIES", "1000")),
+    )
@@ -0,0 +1,48 @@
+"""Settings and user-facing messages for the modules shared by the app and the scheduler.
+
+Nothing here imports Streamlit: prime.py plugs in st.secrets and st.warning /
+st.success at startup, while the scheduler reads the environment and logs.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("flight_tracker")
+
+_secrets = None
+_reporters = {"warning": logger.warning, "success": logger.info}
+
+
+def set_secrets(lookup):
+    """Fallback for settings missing from the environment, e.g. `st.secrets.get`."""
+    global _secrets
+    _secrets = lookup
+
+
+def get_setting(name, default=None):
+    value = os.getenv(name)
+    if value is None and _secrets is not None:
+        try:
+            value = _secrets(name)
+        except Exception:
+            # Streamlit raises when no secrets file exists at all
+            value = None
+    return default if value is None else value
+
+
+def set_reporter(warning=None, success=None):
+    if warning is not None:
+        _reporters["warning"] = warning
+    if success is not None:
+        _reporters["success"] = success
+
+
+def warn(message):
+    _reporters["warning"](message)
+
+
+def success(message):
+    _reporters["success"](message)
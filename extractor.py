@@ -1,12 +1,92 @@
-from serpapi import GoogleSearch
-import streamlit as st
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+from config import get_setting
+from ratelimit import bucket_from_env
+from cache import cache_from_env
+from itinerary import parse_itineraries
+from upstream import UpstreamError, client_from_env
+
+# The client, its rate limiter and the response cache are created on the first
+# search, so importing this module opens no files or connections. They are
+# shared across threads so concurrent scheduler workers respect the SerpAPI quota.
+serpapi_client = None
+response_cache = None
+_upstream_ready = False
+_upstream_lock = threading.Lock()
+
+
+def _upstream():
+    global serpapi_client, response_cache, _upstream_ready
+    if not _upstream_ready:
+        with _upstream_lock:
+            if not _upstream_ready:
+                # SERPAPI_RATE_PER_SEC is the total for all SHARD_COUNT scheduler shards
+                rate_limiter = bucket_from_env(
+                    os.getenv("SERPAPI_RATE_PER_SEC"), os.getenv("SERPAPI_BURST"), os.getenv("SHARD_COUNT", "1")
+                )
+                # Each retry also waits for the rate limiter, so retries stay within the quota
+                serpapi_client = client_from_env(rate_limiter)
+                response_cache = cache_from_env()
+                _upstream_ready = True
+    return serpapi_client, response_cache
+
+
+def _fetch(params):
+    return _upstream()[0].search(params)
+
+
+def _search(params):
+    cache = _upstream()[1]
+    if cache is None:
+        return _fetch(params)
+    return cache.get_or_fetch(params, _fetch)
+
+
+class BookingLink:
+    """Booking URL for an itinerary, fetched from SerpAPI only when first needed."""
+
+    def __init__(self, params, booking_token):
+        self.params = dict(params, booking_token=booking_token)
+        self._url = None
+
+    def for_token(self, booking_token):
+        """Link for another itinerary of the same search."""
+        return BookingLink(self.params, booking_token)
+
+    def resolve(self):
+        if not self:
+            return ""
+        if self._url is None:
+            try:
+                results = _search(self.params)
+                self._url = results.get("search_metadata", {}).get("google_flights_url", "")
+            except Exception as e:
+                print("Error retrieving booking link:", e)
+                return ""
+        return self._url
+
+    def __bool__(self):
+        return bool(self.params.get("booking_token"))
+
+
+def cache_stats():
+    # Before the first search there is nothing to report, and no cache to open
+    if response_cache is None:
+        return {"hits": 0, "misses": 0, "coalesced": 0}
+    return response_cache.stats()
+
+
+
+def generic_flights_link(origin, destination, date_from, date_to, round_trip):
+    generic_link = "https://www.google.com/travel/flights?q=flights+from+"
+    query = f"{origin}+to+{destination}+on+{date_from}"
+    if round_trip and date_to:
+        query += f"+returning+{date_to}"
+    return generic_link + query
 
 
 def extract_flights(origin, destination, date_from, date_to, max_layovers, round_trip, currency, preferred_carriers=None):
-    api_key = os.getenv("SERPAPI_KEY") or st.secrets.get("SERPAPI_KEY")
+    api_key = get_setting("SERPAPI_KEY")
     if not api_key:
         return [],None, "", ""
     params = {
@@ -23,47 +103,25 @@ def extract_flights(origin, destination, date_from, date_to, max_layovers, round
     if round_trip and date_to:
         params["return_date"] = date_to
 
-    results = GoogleSearch(params).get_dict()  # Debugging line to check API response # Debugging line to check API response
+    try:
+        results = _search(params)
+    except UpstreamError as e:
+        # Reported like an error answer, so callers handle both the same way
+        results = {"error": str(e)}
     if "error" in results:
         return {"error": results["error"]}, None , None , None 
     
-    flights = results.get("best_flights", []) + results.get("other_flights", [])  # Debugging line to check API response
+    flights = results.get("best_flights", []) + results.get("other_flights", [])
     insights = results.get("price_insights", [])
 
-    if preferred_carriers and "Any" not in preferred_carriers:
-        filtered_by_carrier = []
-        for flight in flights:
-            flight_legs = flight.get("flights", [])
-            if flight_legs:
-                # Get the airline from the first leg (main carrier)
-                airline = flight_legs[0].get("airline")
-                print(f"DEBUG: Checking airline {airline} against preferred carriers {preferred_carriers}")
-                if airline in preferred_carriers:
-                    filtered_by_carrier.append(flight)
-        flights = filtered_by_carrier
-
-    filtered_flights = []
-    for flight in flights:
-        legs = flight.get("flights") or []
-        if len(legs) - 1 <= max_layovers:  # Number of layovers = number of legs - 1
-            filtered_flights.append(flight)
-
-    # Retrieving the first booking token
-    booking_link = ""
-    if filtered_flights:
-        first_booking_token = filtered_flights[0].get("booking_token")
-        if first_booking_token:
-            params["booking_token"] = first_booking_token
-            try:
-                new_results = GoogleSearch(params).get_dict()
-                booking_link = new_results.get("search_metadata", {}).get("google_flights_url", "")
-            except Exception as e:
-                print("Error retrieving booking link:", e)
-                booking_link = ""
+    # Parsed once into records; the carrier is the airline of the first leg
+    carriers = preferred_carriers if preferred_carriers and "Any" not in preferred_carriers else None
+    itineraries = [itinerary for itinerary in parse_itineraries(flights, currency) if itinerary.accepts(max_layovers, carriers)]
 
-    generic_link = "https://www.google.com/travel/flights?q=flights+from+"
-    query = f"{origin}+to+{destination}+on+{date_from}"
-    if round_trip and date_to:
-        query += f"+returning+{date_to}"
-    generic_link = generic_link +  query    
-    return filtered_flights, insights, booking_link , generic_link
\ No newline at end of file
+    # The booking link costs a second SerpAPI call, so it is only resolved on demand
+    # Callers that pick another itinerary get its link from booking_link.for_token
+    booking_link = BookingLink(params, itineraries[0].booking_token) if itineraries else ""
+
+    generic_link = generic_flights_link(origin, destination, date_from, date_to, round_trip)
+    itineraries.sort(key=lambda itinerary: itinerary.price)
+    return itineraries, insights, booking_link , generic_link
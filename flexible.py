@@ -0,0 +1,89 @@
+"""Flexible-date search: one route searched over a window of travel dates.
+
+The searches run concurrently through extract_flights, so they share the
+SerpAPI response cache and rate limiter, and results are yielded as each
+date completes.
+"""
+import calendar
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import pandas as pd
+
+from extractor import extract_flights
+from itinerary import cheapest
+
+FLEX_WORKERS = int(os.getenv("FLEX_WORKERS", "6"))
+# Upper bound on the searches one flexible query may spend
+FLEX_MAX_SEARCHES = int(os.getenv("FLEX_MAX_SEARCHES", "62"))
+ONE_WAY = "One-way"
+
+
+def date_pairs(date_from, date_to, window, today):
+    """(departure, return) dates to search.
+
+    `window` is a number of days on either side of both dates, or "month" for
+    every remaining day of the departure month with the same trip length.
+    """
+    if window == "month":
+        last_day = calendar.monthrange(date_from.year, date_from.month)[1]
+        departures = [date_from.replace(day=day) for day in range(1, last_day + 1)]
+        stay = (date_to - date_from) if date_to else None
+        pairs = [(d, d + stay if stay is not None else None) for d in departures if d >= today]
+    else:
+        offsets = range(-window, window + 1)
+        departures = [date_from + timedelta(days=o) for o in offsets if date_from + timedelta(days=o) >= today]
+        returns = [date_to + timedelta(days=o) for o in offsets] if date_to else [None]
+        pairs = [(d, r) for d in departures for r in returns if r is None or r >= d]
+    return pairs[:FLEX_MAX_SEARCHES]
+
+
+def _search(origin, destination, departure, return_date, max_layovers, currency, preferred_carriers):
+    flights, _, _, _ = extract_flights(
+        origin=origin,
+        destination=destination,
+        date_from=departure.isoformat(),
+        date_to=return_date.isoformat() if return_date else None,
+        max_layovers=max_layovers,
+        round_trip=return_date is not None,
+        currency=currency,
+        preferred_carriers=preferred_carriers,
+    )
+    best = cheapest(flights) if isinstance(flights, list) else None
+    return {
+        "date_from": departure,
+        "date_to": return_date,
+        "price": best.price if best else None,
+        "airline": best.airline if best else None,
+        "currency": currency,
+    }
+
+
+def search_dates(origin, destination, pairs, max_layovers, currency, preferred_carriers=None, workers=FLEX_WORKERS):
+    """Yield the cheapest fare for each (departure, return) pair as soon as its search finishes."""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            executor.submit(_search, origin, destination, departure, return_date,
+                            max_layovers, currency, preferred_carriers)
+            for departure, return_date in pairs
+        ]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                print(f"Flexible date search failed: {e}")
+    finally:
+        # A caller that stops early should not keep spending searches
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def price_grid(results):
+    """Return date x departure date table of cheapest prices (NaN where nothing was found)."""
+    if not results:
+        return pd.DataFrame()
+    frame = pd.DataFrame(results)
+    frame["date_to"] = frame["date_to"].map(lambda d: d.isoformat() if d else ONE_WAY)
+    frame["date_from"] = frame["date_from"].map(lambda d: d.isoformat())
+    return frame.pivot(index="date_to", columns="date_from", values="price")
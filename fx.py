@@ -0,0 +1,120 @@
+"""Currency conversion from a table of exchange rates.
+
+The shipped data/fx_rates.json makes conversion work offline. When FX_RATES_URL
+is set, the table is refreshed from it at most every FX_RATES_TTL seconds and
+the latest copy is kept in FX_CACHE_PATH. A table older than FX_MAX_AGE_DAYS
+is used with a warning.
+"""
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+import urllib.request
+
+# Routes are searched once in this currency and prices converted for each alert
+CANONICAL_CURRENCY = os.getenv("CANONICAL_CURRENCY", "USD")
+RATES_PATH = os.getenv(
+    "FX_RATES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fx_rates.json")
+)
+RATES_URL = os.getenv("FX_RATES_URL")
+RATES_TTL = int(os.getenv("FX_RATES_TTL", "86400"))
+CACHE_PATH = os.getenv("FX_CACHE_PATH", "fx_rates_cache.json")
+FX_MAX_AGE_DAYS = float(os.getenv("FX_MAX_AGE_DAYS", "7"))
+
+
+class RateTable:
+    __slots__ = ("base", "rates", "as_of")
+
+    def __init__(self, base, rates, as_of=None):
+        self.base = base.upper()
+        self.rates = {currency.upper(): float(rate) for currency, rate in rates.items()}
+        self.rates[self.base] = 1.0
+        self.as_of = as_of
+
+    def __contains__(self, currency):
+        return currency in self.rates
+
+    def rate(self, source, target):
+        """Units of `target` per unit of `source`; raises KeyError for an unknown currency."""
+        if source == target:
+            return 1.0
+        return self.rates[target] / self.rates[source]
+
+    def convert(self, amount, source, target):
+        return amount * self.rate(source, target)
+
+    def age_days(self, now=None):
+        """Days since `as_of`, or None if the table is undated."""
+        if not self.as_of:
+            return None
+        try:
+            moment = datetime.fromisoformat(str(self.as_of)[:10]).replace(tzinfo=timezone.utc)
+        except ValueError:
+            # time_last_update_utc of rate APIs is an RFC 2822 date
+            moment = parsedate_to_datetime(self.as_of)
+        return ((now or datetime.now(timezone.utc)) - moment).total_seconds() / 86400
+
+
+def parse_rates(payload):
+    # Accepts {"base", "rates"} as well as the {"base_code", "rates"} shape of common rate APIs
+    base = payload.get("base") or payload.get("base_code")
+    as_of = payload.get("as_of") or payload.get("date") or payload.get("time_last_update_utc")
+    return RateTable(base, payload["rates"], as_of)
+
+
+def read_rates(path=RATES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return parse_rates(json.load(f))
+
+
+def write_rates(table, path=CACHE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"base": table.base, "as_of": table.as_of, "rates": table.rates}, f, indent=2, sort_keys=True)
+
+
+def fetch_rates(url=RATES_URL, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return parse_rates(json.loads(response.read().decode("utf-8")))
+
+
+def _load():
+    table = _read_or_fetch()
+    age = table.age_days()
+    if age is None or age > FX_MAX_AGE_DAYS:
+        print(f"Warning: exchange rates as of {table.as_of} are stale; set FX_RATES_URL to refresh them")
+    return table
+
+
+def _read_or_fetch():
+    if RATES_URL:
+        if os.path.exists(CACHE_PATH) and time.time() - os.path.getmtime(CACHE_PATH) < RATES_TTL:
+            return read_rates(CACHE_PATH)
+        try:
+            table = fetch_rates(RATES_URL)
+            write_rates(table, CACHE_PATH)
+            return table
+        except Exception as e:
+            print(f"Failed to refresh exchange rates: {e}")
+            if os.path.exists(CACHE_PATH):
+                return read_rates(CACHE_PATH)
+    return read_rates(RATES_PATH)
+
+
+_lock = threading.Lock()
+_table = None
+_loaded_at = 0.0
+
+
+def current_rates():
+    """The rate table, reloaded once it is older than FX_RATES_TTL."""
+    global _table, _loaded_at
+    with _lock:
+        if _table is None or time.time() - _loaded_at > RATES_TTL:
+            _table, _loaded_at = _load(), time.time()
+        return _table
+
+
+def convert(amount, source, target, rates=None):
+    return (rates or current_rates()).convert(amount, source, target)
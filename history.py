@@ -0,0 +1,112 @@
+"""Hourly and daily price rollups per route and travel date.
+
+Each rollup keeps count, min, max and sum of the observed prices plus a small
+weighted sample, so medians can be merged incrementally as new observations
+arrive without rereading raw flight_prices rows.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from itinerary import TIMESTAMP_FORMAT
+from storage import ROLLUP_KEY
+
+RESOLUTIONS = {"hour": "%Y-%m-%dT%H:00", "day": "%Y-%m-%d"}
+# Prices kept per rollup to estimate its median and merge it with later observations
+SAMPLE_SIZE = 64
+
+
+def merge_samples(samples):
+    """Merge (sample, count) pairs into one sample of at most SAMPLE_SIZE prices and its median.
+
+    Each sampled price stands for count / len(sample) observations, so merging
+    a large rollup with a small one keeps their relative weight.
+    """
+    values = np.concatenate([np.asarray(sample, dtype=float) for sample, _ in samples])
+    weights = np.concatenate([np.full(len(sample), count / len(sample)) for sample, count in samples])
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    # Quantile of each sampled price, taken at the middle of its weight
+    centers = (np.cumsum(weights) - weights / 2) / weights.sum()
+    median = float(np.interp(0.5, centers, values))
+    if len(values) <= SAMPLE_SIZE:
+        return values.tolist(), median
+    positions = (np.arange(SAMPLE_SIZE) + 0.5) / SAMPLE_SIZE
+    return np.round(np.interp(positions, centers, values), 2).tolist(), median
+
+
+def rollup_rows(records):
+    """Rollups of a batch of flight_prices records at every resolution."""
+    frame = pd.DataFrame(records)
+    if frame.empty:
+        return []
+    observed = pd.to_datetime(frame["timestamp"], format=TIMESTAMP_FORMAT, errors="coerce")
+    frame = pd.DataFrame({
+        "route": frame["origin_to_destination"],
+        "travel_date": frame["departure_time"].astype(str).str[:10],
+        "currency": frame["currency"],
+        "price": frame["price"].astype(float),
+        "observed": observed,
+    }).dropna(subset=["observed", "price"])
+
+    rows = []
+    for resolution, fmt in RESOLUTIONS.items():
+        keyed = frame.assign(resolution=resolution, bucket_start=frame["observed"].dt.strftime(fmt))
+        grouped = keyed.groupby(ROLLUP_KEY, sort=False)["price"]
+        for key, prices in grouped:
+            sample, median = merge_samples([(prices.to_numpy(), len(prices))])
+            rows.append(dict(
+                zip(ROLLUP_KEY, key),
+                count=len(prices),
+                min_price=float(prices.min()),
+                max_price=float(prices.max()),
+                sum_price=float(prices.sum()),
+                median_price=median,
+                sample=json.dumps(sample),
+            ))
+    return rows
+
+
+def rollup_key(row):
+    return tuple(row[column] for column in ROLLUP_KEY)
+
+
+def rollup_updates(new_rows, existing_rows):
+    """Rows to add to the stored rollups with the same key.
+
+    count, min, max and sum stay those of the new observations, for storage to
+    add atomically; only the sample and its median are merged with the stored
+    ones, which is approximate when two writers merge the same rollup at once.
+    """
+    existing = {rollup_key(row): row for row in existing_rows}
+    updates = []
+    for row in new_rows:
+        old = existing.get(rollup_key(row))
+        if old is None:
+            updates.append(row)
+            continue
+        sample, median = merge_samples([
+            (json.loads(old["sample"]), old["count"]),
+            (json.loads(row["sample"]), row["count"]),
+        ])
+        updates.append(dict(row, median_price=median, sample=json.dumps(sample)))
+    return updates
+
+
+def history_frame(rows):
+    """Chart data for one route: min, median, mean and max per bucket, travel date and currency."""
+    columns = ["travel_date", "currency", "bucket_start", "count", "min_price", "median_price", "mean_price", "max_price"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    frame = pd.DataFrame(rows)
+    frame["mean_price"] = frame["sum_price"] / frame["count"]
+    frame["bucket_start"] = pd.to_datetime(frame["bucket_start"])
+    return frame.sort_values(["travel_date", "currency", "bucket_start"])[columns].reset_index(drop=True)
+
+
+def bucket_before(days, resolution, now=None):
+    """Bucket start that is `days` days old, for retention deletes."""
+    moment = (now or datetime.now()) - pd.Timedelta(days=days)
+    return moment.strftime(RESOLUTIONS[resolution])
@@ -0,0 +1,146 @@
+"""Compact itinerary records, parsed once from a SerpAPI google_flights answer.
+
+The scheduler filters, prices and snapshots these records directly. DataFrames
+are only built at the UI boundary (to_frame), and flight_prices rows at the
+database boundary (to_records).
+"""
+from datetime import datetime
+from sys import intern
+
+import pandas as pd
+
+COLUMNS = [
+    "airline", "price", "currency", "duration_min", "layovers",
+    "layover_info", "origin_to_destination", "departure_time",
+    "arrival_time", "timestamp"
+]
+TIMESTAMP_FORMAT = "%Y-%m-%d %I:%M:%S %p"
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return pd.Timestamp(value).to_pydatetime()
+
+
+def _layover_info(legs):
+    details = []
+    for arrival, departure in zip(legs, legs[1:]):
+        seconds = (_parse_time(departure["departure_airport"]["time"])
+                   - _parse_time(arrival["arrival_airport"]["time"])).total_seconds()
+        details.append(f"{arrival['arrival_airport']['id']} ({int(seconds // 3600)}h {int(seconds % 3600 // 60)}m)")
+    return "; ".join(details) if details else "None"
+
+
+class Itinerary:
+    """One fare of a search result. Airline and airport codes are interned, so the
+    itineraries of a run share one string per code."""
+
+    __slots__ = (
+        "airline", "price", "currency", "duration_min", "layovers", "layover_info",
+        "origin", "destination", "route", "departure_time", "arrival_time", "booking_token",
+    )
+
+    def __init__(self, airline, price, currency, duration_min, layovers, layover_info,
+                 origin, destination, departure_time, arrival_time, booking_token=None):
+        self.airline = intern(airline) if isinstance(airline, str) else airline
+        self.price = float(price)
+        self.currency = intern(currency)
+        self.duration_min = duration_min
+        self.layovers = int(layovers)
+        self.layover_info = layover_info
+        self.origin = intern(origin)
+        self.destination = intern(destination)
+        self.route = intern(f"{origin} - {destination}")
+        self.departure_time = departure_time
+        self.arrival_time = arrival_time
+        self.booking_token = booking_token
+
+    @classmethod
+    def from_api(cls, flight, currency):
+        """Record for one entry of best_flights/other_flights, or None if it has no price or legs."""
+        if not isinstance(flight, dict):
+            return None
+        price = flight.get("total_price") or flight.get("price") or None
+        legs = flight.get("flights") or []
+        if price is None or not legs:
+            return None
+        return cls(
+            legs[0]["airline"], price, currency, flight.get("total_duration"), len(legs) - 1, _layover_info(legs),
+            legs[0]["departure_airport"]["id"], legs[-1]["arrival_airport"]["id"],
+            legs[0]["departure_airport"]["time"], legs[-1]["arrival_airport"]["time"], flight.get("booking_token"),
+        )
+
+    @classmethod
+    def from_record(cls, record):
+        """Inverse of as_record, e.g. for the fares kept in a route snapshot."""
+        origin, _, destination = record["origin_to_destination"].partition(" - ")
+        return cls(
+            record["airline"], record["price"], record["currency"], record.get("duration_min"), record["layovers"],
+            record.get("layover_info"), origin, destination, record.get("departure_time"), record.get("arrival_time"),
+        )
+
+    def accepts(self, max_layovers, carriers=None):
+        return self.layovers <= max_layovers and (carriers is None or self.airline in carriers)
+
+    def as_record(self, timestamp=None):
+        """flight_prices row of this itinerary; without a timestamp the column is left out."""
+        record = {
+            "airline": self.airline,
+            "price": self.price,
+            "currency": self.currency,
+            "duration_min": self.duration_min,
+            "layovers": self.layovers,
+            "layover_info": self.layover_info,
+            "origin_to_destination": self.route,
+            "departure_time": self.departure_time,
+            "arrival_time": self.arrival_time,
+        }
+        if timestamp is not None:
+            record["timestamp"] = timestamp
+        return record
+
+    def __repr__(self):
+        return f"Itinerary({self.route} {self.airline} {self.currency}{self.price:.2f}, {self.layovers} stops)"
+
+
+def parse_itineraries(flights, currency):
+    """Records for the valid entries of a SerpAPI flight list, in their original order."""
+    itineraries = []
+    for flight in flights:
+        itinerary = Itinerary.from_api(flight, currency)
+        if itinerary is not None:
+            itineraries.append(itinerary)
+    return itineraries
+
+
+def cheapest(itineraries, max_layovers=None, carriers=None):
+    """Cheapest itinerary within `max_layovers` stops and on one of `carriers`, or None.
+
+    Ties go to the earliest itinerary, as they did with the DataFrame lookups.
+    """
+    best = None
+    for itinerary in itineraries:
+        if max_layovers is not None and not itinerary.accepts(max_layovers, carriers):
+            continue
+        if best is None or itinerary.price < best.price:
+            best = itinerary
+    return best
+
+
+def observation_timestamp():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def to_records(itineraries, timestamp=None):
+    """flight_prices rows for the itineraries, all stamped with one observation time."""
+    timestamp = timestamp or observation_timestamp()
+    return [itinerary.as_record(timestamp) for itinerary in itineraries]
+
+
+def to_frame(itineraries, timestamp=None):
+    """DataFrame with the transform_flights columns, sorted by price."""
+    if not itineraries:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.DataFrame(to_records(itineraries, timestamp), columns=COLUMNS).sort_values(by="price")
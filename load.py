@@ -1,114 +1,407 @@
-from supabase import create_client, Client
 import pandas as pd
 import datetime
-import streamlit as st
+import atexit
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import queue
+import threading
+import time
+import metrics
+from config import get_setting, success, warn
+from history import bucket_before, history_frame, rollup_key, rollup_rows, rollup_updates
+from storage import ALERT_PAGE_ORDER, OBSERVATION_COLUMNS, RECENT_ROLLUP_COLUMNS, alert_fingerprint, search_bucket, storage_from_env
 
-SUPABASE_URL = os.getenv("SUPABASE_URL") or st.secrets.get("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY")
 
+def _supabase_credentials():
+    return get_setting("SUPABASE_URL"), get_setting("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+FLIGHTS_CHUNK_SIZE = int(os.getenv("FLIGHTS_CHUNK_SIZE", "500"))
+INSERT_RETRIES = int(os.getenv("INSERT_RETRIES", "3"))
+ALERT_PAGE_SIZE = int(os.getenv("ALERT_PAGE_SIZE", "1000"))
+# How long a scheduler run holds the alerts it is notifying before others may retry them
+ALERT_LEASE_SECONDS = int(os.getenv("ALERT_LEASE_SECONDS", "1800"))
+# The scheduler's run priorities are scored from the rollups as well
+HISTORY_ROLLUPS = os.getenv("HISTORY_ROLLUPS", "True") == "True"
+# Rows folded into the rollups per read-merge-write round trip
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+# Retention in days: hourly rollups, daily rollups and raw flight_prices rows (0 keeps raw rows forever)
+HOURLY_HISTORY_DAYS = int(os.getenv("HOURLY_HISTORY_DAYS", "14"))
+DAILY_HISTORY_DAYS = int(os.getenv("DAILY_HISTORY_DAYS", "400"))
+FLIGHT_PRICES_RETENTION_DAYS = int(os.getenv("FLIGHT_PRICES_RETENTION_DAYS", "90"))
 
-def load_flights(df):
-    records = df.to_dict(orient='records') # Print first 5 records for debugging
-    for record in records:
-        supabase.table("flight_prices").insert(record).execute()
+# STORAGE_BACKEND=sqlite keeps everything in a local SQLite file instead of Supabase.
+# The backend is created on first use, so importing this module does not connect.
+storage = None
+_storage_lock = threading.Lock()
 
 
-def load_alert_preferences(data):
-    try:
-        # Normalize all inputs
-        data["origin"] = data["origin"].strip()
-        data["destination"] = data["destination"].strip()
-        data["trip_type"] = data["trip_type"].strip()
-        data["user_email"] = data["user_email"].strip()
-        data["user_phone"] = data["user_phone"].strip()
-        data["max_layovers"] = int(data["max_layovers"])
-        data["target_price"] = float(data["target_price"])
-        data["currency"] = data["currency"].strip()
-        pc = data.get("preferred_carriers")
-        if pc and isinstance(pc, list):
-            data["preferred_carriers"] = pc if "Any" not in pc else None
-        else:
-            data["preferred_carriers"] = None
-
-        if data["preferred_carriers"] is not None:
-            data["preferred_carriers"] = "{" + ",".join(data["preferred_carriers"]) + "}"
-
-        # Convert "None" string to real None for date_to
-        if not data.get("date_to") or data["date_to"] in ["None", "", None]:
-            data["date_to"] = None
-
-        # Ensure timestamp is set correctly
-        if not data.get("timestamp") or data["timestamp"] in ["None", "", None]:
-            from datetime import datetime
-            data["timestamp"] = datetime.now().isoformat()
-
-        # Check for duplicate
-        query = (
-            supabase.table("alerts")
-            .select("id")
-            .eq("origin", data["origin"])
-            .eq("destination", data["destination"])
-            .eq("date_from", data["date_from"])
-            .eq("trip_type", data["trip_type"])
-            .eq("max_layovers", data["max_layovers"])
-            .eq("target_price", data["target_price"])
-            .eq("currency", data["currency"])
-            .eq("user_email", data["user_email"])
-            .eq("user_phone", data["user_phone"])
-        )
-
-        # date_to can be null or a date
-        if data["date_to"] is None:
-            query = query.is_("date_to", None)
-        else:
-            query = query.eq("date_to", data["date_to"])
+def get_storage():
+    global storage
+    if storage is None:
+        with _storage_lock:
+            if storage is None:
+                storage = storage_from_env(_supabase_credentials)
+    return storage
 
-        if data["preferred_carriers"] is None:
-            query = query.is_("preferred_carriers", None)
-        else:
-            query = query.eq("preferred_carriers", data["preferred_carriers"])
 
-        existing = query.execute()
+# Bumped by every write to the alerts table, so cached alert views know when they are stale
+_alerts_version = 0
+_version_lock = threading.Lock()
+
 
-        if existing.data and len(existing.data) > 0:
-            st.warning("Alert already exists with the same parameters.")
+def alerts_version():
+    return _alerts_version
+
+
+def _alerts_changed():
+    global _alerts_version
+    with _version_lock:
+        _alerts_version += 1
+
+
+def _insert_chunk(table, rows, retries=INSERT_RETRIES):
+    # A multi-row insert is a single statement, so retrying a failed chunk cannot duplicate rows.
+    for attempt in range(retries + 1):
+        try:
+            with metrics.timer("db_write"):
+                get_storage().insert_rows(table, rows)
+            metrics.incr("db_rows_written", len(rows))
             return
+        except Exception:
+            if attempt == retries:
+                raise
+            metrics.incr("db_write_retries")
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def insert_rows(table, records, chunk_size=FLIGHTS_CHUNK_SIZE):
+    for start in range(0, len(records), chunk_size):
+        _insert_chunk(table, records[start:start + chunk_size])
+
+
+class BatchWriter:
+    """Background thread that accumulates rows and flushes them in chunks.
+
+    `write` replaces the plain insert into `table` for each drained batch.
+    """
+
+    def __init__(self, table, chunk_size=FLIGHTS_CHUNK_SIZE, max_pending=64, write=None):
+        self.table = table
+        self.chunk_size = chunk_size
+        self.write = write or (lambda batch: insert_rows(self.table, batch, self.chunk_size))
+        # Bounded so a slow backend pushes back on producers instead of buffering without limit
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, records):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.table}-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(records)
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            # Drain whatever else is queued so bursts of searches share chunks
+            try:
+                while len(batch) < self.chunk_size:
+                    batch = batch + self._queue.get_nowait()
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"Failed to write {len(batch)} rows to {self.table}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+
+
+# Counts, sums and extremes are added atomically by storage; the median sample is
+# read, merged and written back, so writers in this process take turns on it
+_rollup_lock = threading.Lock()
+
+
+def record_observations(records):
+    """Fold flight_prices records into the stored hourly and daily rollups."""
+    rows = rollup_rows(records)
+    if not rows:
+        return
+    with _rollup_lock, metrics.timer("rollup_write"):
+        existing = get_storage().select_rollups([rollup_key(row) for row in rows])
+        get_storage().add_rollups(rollup_updates(rows, existing))
+    metrics.incr("rollups_written", len(rows))
 
-        # Insert only if no duplicate
-        response = supabase.table("alerts").insert(data).execute()
 
-        if response.data:
-            st.success("Alert saved.")
+flight_writer = BatchWriter("flight_prices")
+rollup_writer = BatchWriter("price_rollups", chunk_size=ROLLUP_BATCH_SIZE, write=record_observations)
+atexit.register(flight_writer.flush)
+atexit.register(rollup_writer.flush)
+
+
+def load_flights(df, chunk_size=FLIGHTS_CHUNK_SIZE, background=False):
+    load_flight_records(df.to_dict(orient='records'), chunk_size, background)
+
+
+def load_flight_records(records, chunk_size=FLIGHTS_CHUNK_SIZE, background=False):
+    """Store flight_prices rows, e.g. itinerary.to_records(), and fold them into the rollups."""
+    if not records:
+        return
+    if background:
+        flight_writer.submit(records)
+        if HISTORY_ROLLUPS:
+            rollup_writer.submit(records)
+        return
+    insert_rows("flight_prices", records, chunk_size)
+    if HISTORY_ROLLUPS:
+        try:
+            record_observations(records)
+        except Exception as e:
+            warn(f"Failed to update price history: {e}")
+
+
+def flush_writers():
+    flight_writer.flush()
+    rollup_writer.flush()
+
+
+def _normalize_alert(data):
+    data["origin"] = data["origin"].strip()
+    data["destination"] = data["destination"].strip()
+    data["trip_type"] = data["trip_type"].strip()
+    data["user_email"] = data["user_email"].strip()
+    data["user_phone"] = data["user_phone"].strip()
+    data["max_layovers"] = int(data["max_layovers"])
+    data["target_price"] = float(data["target_price"])
+    data["currency"] = data["currency"].strip()
+    pc = data.get("preferred_carriers")
+    if pc and isinstance(pc, list):
+        data["preferred_carriers"] = pc if "Any" not in pc else None
+    else:
+        data["preferred_carriers"] = None
+
+    if data["preferred_carriers"] is not None:
+        data["preferred_carriers"] = "{" + ",".join(data["preferred_carriers"]) + "}"
+
+    # Convert "None" string to real None for date_to
+    if not data.get("date_to") or data["date_to"] in ["None", "", None]:
+        data["date_to"] = None
+
+    # Ensure timestamp is set correctly
+    if not data.get("timestamp") or data["timestamp"] in ["None", "", None]:
+        data["timestamp"] = datetime.datetime.now().isoformat()
+
+    data["fingerprint"] = alert_fingerprint(data)
+    data["search_bucket"] = search_bucket(data)
+    return data
+
+
+def load_alert_preferences(data):
+    try:
+        data = _normalize_alert(data)
+        # Single idempotent round-trip: duplicates are skipped by the unique fingerprint
+        if get_storage().upsert_alerts([data]):
+            _alerts_changed()
+            success("Alert saved.")
         else:
-            st.warning("Alert could not be saved.")
+            warn("Alert already exists with the same parameters.")
     except Exception as e:
-        st.warning(f"Error occurred: {e}")
+        warn(f"Error occurred: {e}")
+
+
+def import_alerts_csv(source, chunk_size=FLIGHTS_CHUNK_SIZE):
+    """Bulk-create alerts from a CSV with one column per alert field.
+
+    preferred_carriers may list several airlines separated by ";". Returns
+    (inserted, skipped) where skipped counts invalid rows and duplicates.
+    """
+    frame = pd.read_csv(source, dtype=str, keep_default_na=False)
+    alerts = {}
+    invalid = 0
+    for record in frame.to_dict(orient="records"):
+        carriers = record.get("preferred_carriers", "")
+        record["preferred_carriers"] = [c.strip() for c in carriers.split(";") if c.strip()] or None
+        try:
+            alert = _normalize_alert(record)
+        except (KeyError, ValueError, AttributeError):
+            invalid += 1
+            continue
+        alerts.setdefault(alert["fingerprint"], alert)
+
+    rows = list(alerts.values())
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        inserted += get_storage().upsert_alerts(rows[start:start + chunk_size])
+    if inserted:
+        _alerts_changed()
+    return inserted, len(frame) - inserted
 
 
 def load_alerts():
     try:
-        response = supabase.table("alerts").select("*").execute()
-        return pd.DataFrame(response.data)
+        return pd.DataFrame(get_storage().select_alerts())
     except Exception as e:
-        st.warning(f"Failed to fetch alerts: {e}")
+        warn(f"Failed to fetch alerts: {e}")
         return pd.DataFrame()
 
+def alert_page(email, phone, page, page_size, origin=None, destination=None):
+    """Page `page` (from 0) of the alerts saved with `email` or `phone`, and the total count."""
+    try:
+        rows, total = get_storage().select_user_alerts(email, phone, page * page_size, page_size, origin, destination)
+        return pd.DataFrame(rows), total
+    except Exception as e:
+        warn(f"Failed to fetch alerts: {e}")
+        return pd.DataFrame(), 0
+
+def iter_alerts(columns, min_date_from, page_size=ALERT_PAGE_SIZE, buckets=None):
+    """Stream alerts departing on or after `min_date_from`, page by page, ordered by search key."""
+    # Each page resumes after the last row read, which needs the ordering columns
+    columns = list(columns) + [c for c in ALERT_PAGE_ORDER if c not in columns]
+    after = None
+    while True:
+        try:
+            page = get_storage().select_alert_page(columns, min_date_from, after, page_size, buckets)
+        except Exception as e:
+            warn(f"Failed to fetch alerts: {e}")
+            return
+        yield from page
+        if len(page) < page_size:
+            return
+        after = tuple(page[-1][c] for c in ALERT_PAGE_ORDER)
+
+def backfill_search_buckets():
+    try:
+        return get_storage().backfill_search_buckets()
+    except Exception as e:
+        warn(f"Failed to backfill search buckets: {e}")
+        return 0
+
+def delete_expired_alerts(today, buckets=None):
+    try:
+        return get_storage().delete_expired_alerts(today.isoformat(), buckets)
+    except Exception as e:
+        warn(f"Failed to delete expired alerts: {e}")
+        return 0
+
+def _utc(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def claim_alerts(ids, owner, lease_seconds=ALERT_LEASE_SECONDS):
+    """Lease alerts to `owner` before notifying; returns the ids no other run holds."""
+    if not ids:
+        return []
+    now = datetime.datetime.now(datetime.timezone.utc)
+    try:
+        return get_storage().claim_alerts(list(ids), owner, _utc(now), _utc(now + datetime.timedelta(seconds=lease_seconds)))
+    except Exception as e:
+        warn(f"Failed to claim alerts: {e}")
+        return []
+
+def release_alerts(ids, owner):
+    if not ids:
+        return
+    try:
+        get_storage().release_alerts(list(ids), owner)
+    except Exception as e:
+        warn(f"Failed to release alerts: {e}")
+
+def mark_alerts_notified(ids, owner):
+    if not ids:
+        return
+    try:
+        get_storage().mark_alerts_notified(list(ids), owner, _utc(datetime.datetime.now(datetime.timezone.utc)))
+    except Exception as e:
+        warn(f"Failed to mark alerts as notified: {e}")
+
+def mark_alert_channels(channels, owner):
+    """Record {alert_id: channels} an alert was delivered on, so a retry skips them."""
+    if not channels:
+        return
+    try:
+        get_storage().mark_alert_channels(
+            {alert_id: ",".join(sorted(kinds)) for alert_id, kinds in channels.items()}, owner)
+    except Exception as e:
+        warn(f"Failed to record alert channels: {e}")
+
+def delete_notified_alerts(buckets=None):
+    try:
+        return get_storage().delete_notified_alerts(buckets)
+    except Exception as e:
+        warn(f"Failed to delete notified alerts: {e}")
+        return 0
+
+def load_recent_rollups(resolution, days, currency):
+    """Rollups of every route in `currency` over the last `days` days, e.g. for run priorities."""
+    try:
+        rows = get_storage().select_recent_rollups(resolution, bucket_before(days, resolution), currency)
+        return pd.DataFrame(rows, columns=RECENT_ROLLUP_COLUMNS)
+    except Exception as e:
+        warn(f"Failed to fetch recent rollups: {e}")
+        return pd.DataFrame(columns=RECENT_ROLLUP_COLUMNS)
+
+def load_price_observations(since=None, routes=None):
+    try:
+        return pd.DataFrame.from_records(get_storage().select_price_observations(since, routes), columns=OBSERVATION_COLUMNS)
+    except Exception as e:
+        warn(f"Failed to fetch price observations: {e}")
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+
+def route_history(route, resolution="day", days=None):
+    """Chart data for `route` ("JFK - LAX") from the stored rollups, see history.history_frame."""
+    if days is None:
+        days = HOURLY_HISTORY_DAYS if resolution == "hour" else DAILY_HISTORY_DAYS
+    try:
+        return history_frame(get_storage().select_route_rollups(route, resolution, bucket_before(days, resolution)))
+    except Exception as e:
+        warn(f"Failed to fetch price history: {e}")
+        return history_frame([])
+
+def compact_history(now=None):
+    """Apply the retention windows; hourly detail outlives its window only in the daily rollups."""
+    now = now or datetime.datetime.now()
+    deleted = {}
+    try:
+        deleted["hourly_rollups"] = get_storage().delete_rollups("hour", bucket_before(HOURLY_HISTORY_DAYS, "hour", now))
+        deleted["daily_rollups"] = get_storage().delete_rollups("day", bucket_before(DAILY_HISTORY_DAYS, "day", now))
+        if FLIGHT_PRICES_RETENTION_DAYS:
+            # flight_prices timestamps start with the date, so a date bound compares correctly as text
+            deleted["flight_prices"] = get_storage().delete_flight_prices(
+                bucket_before(FLIGHT_PRICES_RETENTION_DAYS, "day", now))
+    except Exception as e:
+        warn(f"Failed to compact price history: {e}")
+    return deleted
+
+def load_snapshots(keys):
+    try:
+        return {row["search_key"]: row for row in get_storage().select_snapshots(list(keys))}
+    except Exception as e:
+        warn(f"Failed to fetch route snapshots: {e}")
+        return {}
+
+def save_snapshots(rows):
+    try:
+        get_storage().upsert_snapshots(rows)
+    except Exception as e:
+        warn(f"Failed to save route snapshots: {e}")
+
 def delete_alert(rowid):
     try:
-        supabase.table("alerts").delete().eq("id", rowid).execute()
+        get_storage().delete_alert(rowid)
+        _alerts_changed()
     except Exception as e:
-        st.warning(f"Failed to delete alert: {e}")
+        warn(f"Failed to delete alert: {e}")
 
 def update_alert_price(rowid, new_price):
     try:
-        supabase.table("alerts").update({"target_price": new_price}).eq("id", rowid).execute()
+        get_storage().update_alert_price(rowid, new_price)
+        _alerts_changed()
     except Exception as e:
-        st.warning(f"Failed to update alert: {e}")
+        warn(f"Failed to update alert: {e}")
 
 
         
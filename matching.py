@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from fx import current_rates
+from itinerary import cheapest
+
+# Alerts in different currencies share a search; prices are converted per alert
+SEARCH_KEY = ["origin", "destination", "date_from", "date_to", "trip_type"]
+
+
+def _optional(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and pd.isna(value):
+        return None
+    return value
+
+
+def search_key(row):
+    return tuple(_optional(row.get(column)) for column in SEARCH_KEY)
+
+
+def carrier_filter(value):
+    value = _optional(value)
+    if value is None or len(value) == 0 or "Any" in value:
+        return None
+    return list(value)
+
+
+def conversion_factors(pairs, rates):
+    # Fare currency units per alert currency unit; NaN when a currency is unknown
+    factors = []
+    for alert_currency, fare_currency in pairs:
+        if alert_currency == fare_currency:
+            factors.append(1.0)
+            continue
+        rates = rates or current_rates()
+        try:
+            factors.append(rates.rate(alert_currency, fare_currency))
+        except KeyError:
+            print(f"No exchange rate between {alert_currency} and {fare_currency}")
+            factors.append(np.nan)
+    return factors
+
+
+def match_alerts(itineraries, alerts, rates=None):
+    """Evaluate every alert of one route against the itineraries of a single search.
+
+    Alerts that share a layover and carrier filter share one scan for their
+    cheapest qualifying itinerary, and each alert's target is converted into
+    the fare currency once per currency pair. Returns {alert_id: match} for
+    the triggered alerts, where a match is the itinerary's record plus the
+    alert fields, priced in the alert's currency, and its booking token.
+    """
+    if not itineraries or not alerts:
+        return {}
+
+    best, factors, matches = {}, {}, {}
+    for alert in alerts:
+        max_layovers = int(alert["max_layovers"])
+        carriers = carrier_filter(alert.get("preferred_carriers"))
+        selection = (max_layovers, frozenset(carriers) if carriers is not None else None)
+        if selection not in best:
+            best[selection] = cheapest(itineraries, max_layovers, selection[1])
+        itinerary = best[selection]
+        if itinerary is None:
+            continue
+
+        pair = (alert["currency"], itinerary.currency)
+        if pair not in factors:
+            factors[pair] = conversion_factors([pair], rates)[0]
+        factor = factors[pair]
+        target_price = float(alert["target_price"])
+        # Never true for a NaN factor, so alerts in an unknown currency do not fire
+        if not itinerary.price <= target_price * factor:
+            continue
+        matches[alert["id"]] = dict(
+            itinerary.as_record(),
+            max_layovers=max_layovers,
+            target_price=target_price,
+            price=itinerary.price / factor,
+            currency=alert["currency"],
+            fare_price=itinerary.price,
+            fare_currency=itinerary.currency,
+            booking_token=itinerary.booking_token,
+        )
+    return matches
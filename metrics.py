@@ -0,0 +1,112 @@
+"""In-process counters and timers, summarized at the end of a run.
+
+    with metrics.timer("serpapi_request"):
+        ...
+    metrics.incr("alerts_triggered")
+
+Set METRICS_OUTPUT to a path to have scheduler.py write the summary there:
+JSON by default, or a Prometheus textfile when the path ends in .prom.
+"""
+import json
+import os
+import threading
+import time
+
+METRICS_OUTPUT = os.getenv("METRICS_OUTPUT")
+PREFIX = "flight_tracker"
+
+_lock = threading.Lock()
+_counters = {}
+# name -> [count, total seconds, max seconds]
+_timers = {}
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+
+class timer:
+    """Context manager recording the duration of its block under `name`."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def summary():
+    with _lock:
+        counters = dict(_counters)
+        timers = {name: list(stats) for name, stats in _timers.items()}
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "counters": counters,
+        "timers": {
+            name: {
+                "count": count,
+                "total_s": round(total, 6),
+                "mean_ms": round(total / count * 1000, 3),
+                "max_ms": round(longest * 1000, 3),
+            }
+            for name, (count, total, longest) in sorted(timers.items())
+        },
+    }
+
+
+def to_prometheus(report):
+    lines = []
+    for name, value in sorted(report["counters"].items()):
+        metric = f"{PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, stats in report["timers"].items():
+        metric = f"{PREFIX}_{name}_seconds"
+        lines += [
+            f"# TYPE {metric} summary",
+            f"{metric}_count {stats['count']}",
+            f"{metric}_sum {stats['total_s']}",
+            f"# TYPE {metric}_max gauge",
+            f"{metric}_max {stats['max_ms'] / 1000}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write(path=METRICS_OUTPUT):
+    """Write the summary to `path`; returns the summary."""
+    report = summary()
+    if path.endswith(".prom"):
+        text = to_prometheus(report)
+    else:
+        text = json.dumps(report, indent=2) + "\n"
+    # Written to a temporary file first so collectors never read a partial textfile
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return report
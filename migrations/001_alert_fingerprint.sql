@@ -0,0 +1,8 @@
+-- Unique content hash used by load_alert_preferences / import_alerts_csv for
+-- single round-trip idempotent inserts (upsert ... on conflict do nothing).
+alter table alerts add column if not exists fingerprint text;
+
+-- Existing rows need a fingerprint before they are protected by the index:
+--   python -c "import load; print(load.get_storage().backfill_fingerprints())"
+-- Remove any duplicates it reveals, then:
+create unique index if not exists alerts_fingerprint_key on alerts (fingerprint);
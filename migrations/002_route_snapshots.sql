@@ -0,0 +1,12 @@
+-- Last result seen by the scheduler for each search key, used to re-evaluate
+-- alerts without a new SerpAPI call and to skip unchanged routes.
+create table if not exists route_snapshots (
+    search_key text primary key,
+    cheapest_price double precision,
+    airline text,
+    currency text,
+    observed_at text,
+    response_hash text,
+    alerts_hash text,
+    fares text
+);
@@ -0,0 +1,11 @@
+-- Sharded scheduler runs: each shard reads the alerts of its own search
+-- buckets, and leases triggered alerts before notifying them so overlapping
+-- or crashed runs never send the same alert twice.
+alter table alerts add column if not exists search_bucket smallint;
+alter table alerts add column if not exists lease_owner text;
+alter table alerts add column if not exists lease_expires_at timestamptz;
+alter table alerts add column if not exists notified_at timestamptz;
+
+-- Existing rows need a bucket before sharded runs can see them:
+--   python -c "import load; print(load.get_storage().backfill_search_buckets())"
+create index if not exists alerts_search_bucket_idx on alerts (search_bucket);
@@ -0,0 +1,3 @@
+-- The Manage Alerts tab lists one user's alerts a page at a time, by email or phone.
+create index if not exists alerts_user_email_idx on alerts (user_email, date_from);
+create index if not exists alerts_user_phone_idx on alerts (user_phone, date_from);
@@ -0,0 +1,23 @@
+-- Hourly and daily price rollups per route and travel date, maintained by
+-- load.record_observations as flight_prices rows are written and read by the
+-- Price Insights tab. bucket_start is text ("YYYY-MM-DD" or "YYYY-MM-DDTHH:00")
+-- so retention compares it the same way on every backend.
+create table if not exists price_rollups (
+    route text not null,
+    travel_date text not null,
+    currency text not null,
+    resolution text not null,
+    bucket_start text not null,
+    count integer not null,
+    min_price double precision,
+    max_price double precision,
+    sum_price double precision,
+    median_price double precision,
+    sample text,
+    primary key (route, travel_date, currency, resolution, bucket_start)
+);
+
+create index if not exists price_rollups_retention_idx on price_rollups (resolution, bucket_start);
+
+-- Lets load.compact_history delete expired raw observations without a full scan
+create index if not exists flight_prices_timestamp_idx on flight_prices (timestamp);
@@ -0,0 +1,27 @@
+-- Folds new observations into price_rollups in one statement, so scheduler
+-- shards and the app updating the same rollup never lose each other's counts.
+-- Counts and sums are added and min/max widened; median_price and sample are
+-- the caller's merged estimate and simply replace the stored ones.
+create or replace function add_price_rollups(rows jsonb) returns void
+language sql
+as $$
+    insert into price_rollups (
+        route, travel_date, currency, resolution, bucket_start,
+        count, min_price, max_price, sum_price, median_price, sample
+    )
+    select
+        route, travel_date, currency, resolution, bucket_start,
+        count, min_price, max_price, sum_price, median_price, sample
+    from jsonb_to_recordset(rows) as r (
+        route text, travel_date text, currency text, resolution text, bucket_start text,
+        count integer, min_price double precision, max_price double precision,
+        sum_price double precision, median_price double precision, sample text
+    )
+    on conflict (route, travel_date, currency, resolution, bucket_start) do update set
+        count = price_rollups.count + excluded.count,
+        min_price = least(price_rollups.min_price, excluded.min_price),
+        max_price = greatest(price_rollups.max_price, excluded.max_price),
+        sum_price = price_rollups.sum_price + excluded.sum_price,
+        median_price = excluded.median_price,
+        sample = excluded.sample;
+$$;
@@ -0,0 +1,4 @@
+-- Channels ("email", "sms") a triggered alert was already delivered on. An
+-- alert whose other channel failed is released for a retry, which then only
+-- sends the channels missing from this list.
+alter table alerts add column if not exists notified_channels text;
@@ -0,0 +1,15 @@
+-- Alerts saved before 003_alert_leases.sql have no search_bucket, and every
+-- scheduler shard filters on it, so no shard would ever check them. This is
+-- storage.search_bucket in SQL: the first 8 hex digits of the sha256 of the
+-- "|"-joined search key (NULL as ""), modulo 256.
+update alerts
+set search_bucket = (
+    ('x' || substr(encode(sha256(convert_to(concat_ws('|',
+        coalesce(btrim(origin::text), ''),
+        coalesce(btrim(destination::text), ''),
+        coalesce(btrim(date_from::text), ''),
+        coalesce(btrim(date_to::text), ''),
+        coalesce(btrim(trip_type::text), '')
+    ), 'UTF8')), 'hex'), 1, 8))::bit(32)::bigint % 256
+)::smallint
+where search_bucket is null;
@@ -1,13 +1,43 @@
-from twilio.rest import Client
 import smtplib
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 import os
 from dotenv import load_dotenv
+import metrics
+from config import logger
+from fx import convert
+from itinerary import cheapest
 load_dotenv()
 
-def send_sms(body, to_phone):
-    client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "True") == "True"
+
+def _twilio_client():
+    # twilio is only imported by runs that actually send SMS
+    from twilio.rest import Client
+    return Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+
+def _smtp_session():
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+    if SMTP_STARTTLS:
+        server.starttls()
+    if os.getenv("EMAIL_APP_PASSWORD"):
+        server.login(os.getenv("EMAIL_SENDER"), os.getenv("EMAIL_APP_PASSWORD"))
+    return server
+
+def _email_message(subject, body, to_email):
+    msg = MIMEText(body, 'html')
+    msg['Subject'] = subject
+    msg['From'] = os.getenv("EMAIL_SENDER")
+    msg['To'] = to_email
+    return msg
+
+def send_sms(body, to_phone, client=None):
+    client = client or _twilio_client()
     client.messages.create(
         body=body,
         from_=os.getenv("TWILIO_FROM_NUMBER"),
@@ -15,25 +45,119 @@ def send_sms(body, to_phone):
     )
 
 def send_email(subject, body, to_email):
-    msg = MIMEText(body, 'html')
-    msg['Subject'] = subject
-    msg['From'] = os.getenv("EMAIL_SENDER")
-    msg['To'] = to_email
-    server = smtplib.SMTP('smtp.gmail.com', 587)
-    server.starttls()
-    server.login(os.getenv("EMAIL_SENDER"), os.getenv("EMAIL_APP_PASSWORD"))
+    msg = _email_message(subject, body, to_email)
+    server = _smtp_session()
     server.sendmail(msg['From'], [msg['To']], msg.as_string())
     server.quit()
 
-def check_alert(df, target_price, currency, booking_link=None, generic_link=None, user_email=None, user_phone=None):
-    flag = False
-    if df.empty:
-        return
 
-    price = df['price'].min()
-    flight_currency = df.iloc[0]['currency']
-    cheapest_flight = df[df['price'] == price].iloc[0]
+class NotificationDispatcher:
+    """Outbox for one scheduler run.
+
+    Messages are queued with `enqueue_email`/`enqueue_sms` and delivered by
+    `flush`, reusing one authenticated SMTP session and one Twilio client.
+    With `digest=True`, emails to the same recipient are merged into one.
+    """
+
+    def __init__(self, workers=4, retries=3, digest=False):
+        self.workers = workers
+        self.retries = retries
+        self.digest = digest
+        self.outbox = []
+        self._smtp = None
+        self._smtp_lock = threading.Lock()
+        self._twilio = None
+        self._twilio_lock = threading.Lock()
+
+    def enqueue_email(self, subject, body, to_email, alert_id=None):
+        self.outbox.append({"kind": "email", "to": to_email, "subject": subject, "body": body, "alert_ids": [alert_id]})
+
+    def enqueue_sms(self, body, to_phone, alert_id=None):
+        self.outbox.append({"kind": "sms", "to": to_phone, "body": body, "alert_ids": [alert_id]})
+
+    def _digest(self, messages):
+        merged = {}
+        result = []
+        for message in messages:
+            if message["kind"] != "email":
+                result.append(message)
+                continue
+            existing = merged.get(message["to"])
+            if existing is None:
+                merged[message["to"]] = dict(message, alert_ids=list(message["alert_ids"]))
+                result.append(merged[message["to"]])
+            else:
+                existing["body"] += "<hr>" + message["body"]
+                existing["alert_ids"] += message["alert_ids"]
+                existing["subject"] = f"Flight Price Alerts ({len(existing['alert_ids'])} deals)"
+        return result
+
+    def _send_email(self, message):
+        msg = _email_message(message["subject"], message["body"], message["to"])
+        # smtplib sessions are not thread-safe, so email delivery shares the session serially
+        with self._smtp_lock:
+            if self._smtp is None:
+                self._smtp = _smtp_session()
+            try:
+                self._smtp.sendmail(msg['From'], [msg['To']], msg.as_string())
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                raise
+
+    def _send_sms(self, message):
+        with self._twilio_lock:
+            if self._twilio is None:
+                self._twilio = _twilio_client()
+        send_sms(message["body"], message["to"], client=self._twilio)
+
+    def _deliver(self, message):
+        send = self._send_email if message["kind"] == "email" else self._send_sms
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timer(f"{message['kind']}_send"):
+                    send(message)
+                metrics.incr(f"{message['kind']}_sent")
+                return True
+            except Exception as e:
+                print(f"Failed to send {message['kind']} to {message['to']} (attempt {attempt + 1}): {e}")
+                if attempt < self.retries:
+                    metrics.incr("notification_retries")
+                    time.sleep(0.5 * 2 ** attempt)
+        metrics.incr(f"{message['kind']}_failed")
+        return False
 
+    def flush(self):
+        """Send everything in the outbox.
+
+        Returns {alert_id: {channel: delivered}} for the alerts in the outbox, with
+        channel "email" or "sms"; a channel is only delivered if all its messages were.
+        """
+        messages, self.outbox = self.outbox, []
+        if self.digest:
+            messages = self._digest(messages)
+        outcome = {}
+        if messages:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for message, sent in zip(messages, executor.map(self._deliver, messages)):
+                    for alert_id in message["alert_ids"]:
+                        if alert_id is not None:
+                            channels = outcome.setdefault(alert_id, {})
+                            channels[message["kind"]] = channels.get(message["kind"], True) and sent
+        return outcome
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+
+def render_alert(cheapest_flight, target_price, booking_link=None, generic_link=None):
+    """Subject, SMS text and HTML email body for a triggered alert."""
+    price = cheapest_flight['price']
+    flight_currency = cheapest_flight['currency']
     departure_time_raw = cheapest_flight['departure_time']
     arrival_time_raw = cheapest_flight['arrival_time']
 
@@ -47,55 +171,93 @@ def check_alert(df, target_price, currency, booking_link=None, generic_link=None
     except Exception:
         arrival_time = arrival_time_raw
 
-    origin_to_destination = cheapest_flight['origin_to_destination']
-
-    print("DEBUG: Cheapest flight price:", price)
-    print("DEBUG: Target price:", target_price)
-    print("DEBUG: user_email:", user_email)
-    print("DEBUG: user_phone:", user_phone)
-    print("DEBUG: SET_SMS_ALERT:", os.getenv("SET_SMS_ALERT"))
-    print("DEBUG: SET_EMAIL_ALERT:", os.getenv("SET_EMAIL_ALERT"))
-
-    if flight_currency == currency and price <= target_price:
-
-        # ✉️ SMS Message (Plain Text)
-        sms_message = (
-        f"Flight deal alert! : {flight_currency}{price:.0f} (target {flight_currency}{target_price})\n"
-        )
-        if booking_link:
-            sms_message += f"{booking_link}"
-        if generic_link:
-            sms_message += f"{generic_link}"
-
-        # 📧 HTML Email
-        html_message = f"""
-        <p>✈️ <strong>Flight deal alert! </strong></p>
-        <ul>
-            <li><strong>Price:</strong> {flight_currency}{price:.2f} (below your target of {flight_currency}{target_price})</li>
-            <li><strong>Airline:</strong> {cheapest_flight['airline']}</li>
-            <li><strong>Duration:</strong> {int(cheapest_flight['duration_min'] // 60)}h {int(cheapest_flight['duration_min'] % 60)}m</li>
-            <li><strong>Layovers:</strong> {cheapest_flight['layovers']}</li>
-            <li><strong>Layover Details:</strong> {cheapest_flight['layover_info']}</li>
-            <li><strong>Departure:</strong> {departure_time}</li>
-            <li><strong>Arrival:</strong> {arrival_time}</li>
-        </ul>
-        """
+    # Lazy booking links are resolved only once the alert actually fires
+    if hasattr(booking_link, "resolve"):
+        booking_link = booking_link.resolve()
+
+    # Prices found in another currency are shown converted, with the original fare
+    fare_currency = cheapest_flight.get('fare_currency', flight_currency)
+    converted = ""
+    if fare_currency != flight_currency:
+        converted = f" ≈ converted from {fare_currency}{cheapest_flight['fare_price']:.2f}"
+
+    # ✉️ SMS Message (Plain Text)
+    sms_message = (
+    f"Flight deal alert! : {flight_currency}{price:.0f} (target {flight_currency}{target_price})\n"
+    )
+    if booking_link:
+        sms_message += f"{booking_link}"
+    if generic_link:
+        sms_message += f"{generic_link}"
+
+    # 📧 HTML Email
+    html_message = f"""
+    <p>✈️ <strong>Flight deal alert! </strong></p>
+    <ul>
+        <li><strong>Price:</strong> {flight_currency}{price:.2f} (below your target of {flight_currency}{target_price}){converted}</li>
+        <li><strong>Airline:</strong> {cheapest_flight['airline']}</li>
+        <li><strong>Duration:</strong> {int(cheapest_flight['duration_min'] // 60)}h {int(cheapest_flight['duration_min'] % 60)}m</li>
+        <li><strong>Layovers:</strong> {cheapest_flight['layovers']}</li>
+        <li><strong>Layover Details:</strong> {cheapest_flight['layover_info']}</li>
+        <li><strong>Departure:</strong> {departure_time}</li>
+        <li><strong>Arrival:</strong> {arrival_time}</li>
+    </ul>
+    """
+
+    if booking_link:
+        html_message += f'<p><a href="{booking_link}">🔗 Book Now</a></p>'
+    if generic_link:
+        html_message += f'<p><a href="{generic_link}">🌐 Explore more flights</a></p>'
 
-        if booking_link:
-            html_message += f'<p><a href="{booking_link}">🔗 Book Now</a></p>'
-        if generic_link:
-            html_message += f'<p><a href="{generic_link}">🌐 Explore more flights</a></p>'
+    subject = f"Flight Price Alert [{cheapest_flight['origin_to_destination']}]"
+    return subject, sms_message, html_message
 
-        if os.getenv("SET_SMS_ALERT") == "True" and user_phone:
+
+def delivered_channels(row):
+    """Channels ("email", "sms") an earlier attempt already delivered the alert row on."""
+    return set(filter(None, (row.get("notified_channels") or "").split(",")))
+
+
+def send_alert(subject, sms_message, html_message, user_email=None, user_phone=None, dispatcher=None, alert_id=None, skip=()):
+    # `skip` holds the channels an earlier attempt already delivered
+    if os.getenv("SET_SMS_ALERT") == "True" and user_phone and "sms" not in skip:
+        if dispatcher is not None:
+            dispatcher.enqueue_sms(sms_message, user_phone, alert_id)
+        else:
             print("Sending SMS alert...")
             send_sms(sms_message, user_phone)
 
-        if os.getenv("SET_EMAIL_ALERT") == "True" and user_email:
+    if os.getenv("SET_EMAIL_ALERT") == "True" and user_email and "email" not in skip:
+        if dispatcher is not None:
+            dispatcher.enqueue_email(subject, html_message, user_email, alert_id)
+        else:
             print("Sending Email alert...")
-            send_email(f"Flight Price Alert [{origin_to_destination}]", html_message, user_email)
+            send_email(subject, html_message, user_email)
+
+
+def check_alert(itineraries, target_price, currency, booking_link=None, generic_link=None, user_email=None, user_phone=None, dispatcher=None, alert_id=None):
+    best = cheapest(itineraries)
+    if best is None:
+        return
+
+    price = best.price
+    flight_currency = best.currency
+    cheapest_flight = best.as_record()
+
+    logger.debug("Cheapest fare %.2f %s against target %s %s", price, flight_currency, target_price, currency)
 
+    if flight_currency != currency:
+        try:
+            target_price = round(convert(target_price, currency, flight_currency), 2)
+        except KeyError:
+            print(f"No exchange rate between {currency} and {flight_currency}")
+            return False
+
+    if price <= target_price:
+        if hasattr(booking_link, "for_token"):
+            booking_link = booking_link.for_token(best.booking_token)
+        subject, sms_message, html_message = render_alert(cheapest_flight, target_price, booking_link, generic_link)
+        send_alert(subject, sms_message, html_message, user_email, user_phone, dispatcher, alert_id)
         return True
 
     return False
-
-        
@@ -4,23 +4,81 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 from extractor import extract_flights
-from transformer import transform_flights
-from load import load_flights, load_alert_preferences, load_alerts, delete_alert, update_alert_price
+from itinerary import to_frame
+from load import load_flights, load_alert_preferences, alert_page, alerts_version, delete_alert, route_history, update_alert_price
 from notifications import check_alert
+from airports import load_index
+from snapshots import reevaluate_alert
+from flexible import date_pairs, price_grid, search_dates
+from config import set_reporter, set_secrets
 
-url = "https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat"
-columns = [
-    "id", "name", "city", "country", "IATA", "icao",
-    "latitude", "longitude", "altitude", "timezone", "dst",
-    "tz_database", "type", "source"
-]
+# The shared modules read secrets and report problems through the app
+set_secrets(st.secrets.get)
+set_reporter(warning=st.warning, success=st.success)
 
-@st.cache_data
+@st.cache_resource
 def load_airports():
-    df = pd.read_csv(url, header=None, names=columns)
-    df["label"] = df["city"] + " - " + df["name"] + " (" + df["IATA"] + ")"
-    return df
-airports_df = load_airports()
+    return load_index()
+airport_index = load_airports()
+FLEX_WINDOWS = {"±1 day": 1, "±3 days": 3, "Whole month": "month"}
+
+def price_heatmap(grid, symbol):
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(),
+        x=list(grid.columns),
+        y=list(grid.index),
+        text=[[f"{symbol}{price:.0f}" if price == price else "" for price in row] for row in grid.to_numpy()],
+        texttemplate="%{text}",
+        colorscale="RdYlGn_r",
+        hovertemplate="Depart %{x}<br>Return %{y}<br>%{text}<extra></extra>",
+    ))
+    fig.update_layout(xaxis_title="Departure", yaxis_title="Return", template="plotly_dark",
+                      height=max(250, 45 * len(grid.index) + 120))
+    return fig
+
+HISTORY_RESOLUTIONS = {"Daily": "day", "Hourly": "hour"}
+
+# Served from the price rollups, so charting a route never rescans flight_prices or calls SerpAPI
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_route_history(route, resolution):
+    return route_history(route, resolution)
+
+def history_chart(history, symbol):
+    fig = go.Figure([
+        go.Scatter(x=history["bucket_start"], y=history["max_price"], name="Highest", mode="lines",
+                   line=dict(width=0.5, color="indianred")),
+        go.Scatter(x=history["bucket_start"], y=history["min_price"], name="Lowest", mode="lines",
+                   line=dict(width=0.5, color="seagreen"), fill="tonexty", fillcolor="rgba(128,128,128,0.2)"),
+        go.Scatter(x=history["bucket_start"], y=history["median_price"], name="Median", mode="lines+markers",
+                   line=dict(color="white"), customdata=history["count"],
+                   hovertemplate=f"{symbol}%{{y:.0f}} median of %{{customdata}} fares<extra></extra>"),
+    ])
+    fig.update_layout(xaxis_title="Observed", yaxis_title=f"Price ({symbol})", hovermode="x unified",
+                      template="plotly_dark", height=400)
+    return fig
+
+ALERT_PAGE_SIZES = [10, 25, 50]
+
+def _format_dates(values, fmt, default="N/A"):
+    parsed = pd.to_datetime(values, format="mixed", errors="coerce")
+    return parsed.dt.strftime(fmt).fillna(default)
+
+# Keyed by the alerts version, so only a save, update or delete refetches; the TTL
+# picks up alerts removed by the scheduler in the meantime.
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_alert_page(email, phone, page, page_size, origin, destination, version):
+    alerts, total = alert_page(email, phone, page, page_size, origin or None, destination or None)
+    if not alerts.empty:
+        alerts = alerts.assign(
+            date_from_text=_format_dates(alerts["date_from"], "%b %d, %Y"),
+            date_to_text=_format_dates(alerts["date_to"], "%b %d, %Y"),
+            created_text=_format_dates(alerts["timestamp"], "%b %d, %Y %I:%M %p"),
+        )
+    return alerts, total
+
+def _first_alert_page():
+    st.session_state["alerts_page"] = 0
+
 currency_symbols = {"USD": "$", "EUR": "€", "GBP": "£", "INR": "₹", "JPY": "¥", "AUD": "A$", "CAD": "C$", "CNY": "¥", "CHF": "CHF", "RUB": "₽", "ZAR": "R"}
 
 st.set_page_config(page_title="Flight Price Tracker", layout="centered")
@@ -42,20 +100,22 @@ tab1, tab2, tab3 = st.tabs(["🔍 Search Flights", "📈 Price Insights", "🔔
 with tab1:
     is_round_trip = st.toggle("Round-Trip", value=True)
     trip_type = "Round-Trip" if is_round_trip else "One-Way"
+    flexible = st.toggle("Flexible dates", value=False, help="Compare prices over nearby dates instead of one exact date.")
+    flex_window = st.selectbox("Date window", list(FLEX_WINDOWS), index=1) if flexible else None
 
     with st.form("search_form"):
         origin_label = st.selectbox(
             "Origin",
-            options = airports_df["label"].tolist(),
-            index=int(airports_df[airports_df["IATA"] == "SEA"].index[0]),
+            options = airport_index.labels,
+            index=airport_index.position("SEA"),
             placeholder="Type to search airports...")
-        origin = airports_df.loc[airports_df["label"] == origin_label, "IATA"].values[0]
+        origin = airport_index.iata_for(origin_label)
         destination_label = st.selectbox(
             "Destination",
-            options = airports_df["label"].tolist(),
-            index=int(airports_df[airports_df["IATA"] == "SJC"].index[0]),
+            options = airport_index.labels,
+            index=airport_index.position("SJC"),
             placeholder="Type to search airports...")
-        destination = airports_df.loc[airports_df["label"] == destination_label, "IATA"].values[0]
+        destination = airport_index.iata_for(destination_label)
         date_from = st.date_input("Departure Date")
         date_to = st.date_input("Return Date") if is_round_trip else None
         max_layovers = st.slider("Max Layovers", 0, 3, 1)
@@ -95,7 +155,32 @@ with tab1:
             st.warning("Please enter a valid phone number with country code in the sidebar.", icon="⚠️")
             response_flag = False
 
-        if response_flag:
+        if response_flag and flexible:
+            symbol = currency_symbols.get(selected_currency, "$")
+            pairs = date_pairs(date_from, date_to, FLEX_WINDOWS[flex_window], datetime.now().date())
+            # Each date is drawn as soon as its search returns rather than after the slowest one
+            chart = st.empty()
+            progress = st.progress(0.0, text=f"Searching {len(pairs)} date combinations...")
+            results = []
+            for result in search_dates(
+                origin.upper(), destination.upper(), pairs, max_layovers, selected_currency,
+                preferred_carriers if "Any" not in preferred_carriers else None,
+            ):
+                results.append(result)
+                progress.progress(len(results) / len(pairs), text=f"Searched {len(results)} of {len(pairs)} date combinations")
+                chart.plotly_chart(price_heatmap(price_grid(results), symbol), use_container_width=True)
+            progress.empty()
+
+            priced = [r for r in results if r["price"] is not None]
+            if not priced:
+                st.warning("No flights found for the given criteria. Please adjust your search.", icon="⚠️")
+            else:
+                best = min(priced, key=lambda r: r["price"])
+                returning = f", returning {best['date_to']:%b %d}" if best["date_to"] else ""
+                st.success(f"Cheapest: {symbol}{best['price']:.0f} with {best['airline']} departing {best['date_from']:%b %d}{returning}.")
+            st.info("To set a price alert, search one of these dates with flexible dates turned off.", icon="ℹ️")
+
+        elif response_flag:
             with st.spinner("Searching for flights... This can take up to 15 seconds."):
                 flights, insights, booking_link , generic_link = extract_flights(
                     origin = origin.upper(),
@@ -109,7 +194,7 @@ with tab1:
                 )  # Debugging line to check API response
 
             # print(flights)  # Debugging line to check API response
-            if "error" in flights:
+            if isinstance(flights, dict):
                 st.error(f"Error: {flights['error']}", icon="🚫")
 
             elif not flights or insights is None:
@@ -119,15 +204,15 @@ with tab1:
                 st.session_state["booking_link"] = booking_link
                 st.session_state["generic_link"] = generic_link
                 st.session_state["currency"] = selected_currency
-                df = transform_flights(flights,st.session_state["currency"])
-
-                if preferred_carriers and "Any" not in preferred_carriers:
-                    df = df[df["airline"].isin(preferred_carriers)]
+                st.session_state["history_origin"] = origin.upper()
+                st.session_state["history_destination"] = destination.upper()
+                # extract_flights has already applied the carrier and layover filters
+                df = to_frame(flights)
 
                 if df.empty:
                     st.warning("No flights found for the given criteria. Please adjust your search.", icon="⚠️")
                 else:
-                    load_flights(df)
+                    load_flights(df, background=True)
                     if len(df) >= 5:
                         st.dataframe(df[:5], hide_index=True, use_container_width=True)
                     else:
@@ -242,34 +327,79 @@ with tab2:
     f"The current lowest price is {symbol}{lp['lowest_price']}, which is considered {delta_text}. {delta_obs}."
     )
 
+    st.subheader("📉 Tracked Price History")
+    hcol1, hcol2, hcol3 = st.columns(3)
+    history_origin = hcol1.text_input("Origin", max_chars=3, key="history_origin", placeholder="JFK")
+    history_destination = hcol2.text_input("Destination", max_chars=3, key="history_destination", placeholder="LAX")
+    resolution = hcol3.radio("Resolution", list(HISTORY_RESOLUTIONS), horizontal=True, key="history_resolution")
+    if history_origin.strip() and history_destination.strip():
+        route = f"{history_origin.strip().upper()} - {history_destination.strip().upper()}"
+        history = cached_route_history(route, HISTORY_RESOLUTIONS[resolution])
+        if history.empty:
+            st.info("No prices have been tracked for this route yet. Every search and alert check adds to its history.", icon="ℹ️")
+        else:
+            series = list(history[["travel_date", "currency"]].drop_duplicates().itertuples(index=False, name=None))
+            travel_date, currency = st.selectbox(
+                "Travel date", series, format_func=lambda item: f"{item[0]} ({item[1]})", key="history_travel_date",
+            )
+            selected = history[(history["travel_date"] == travel_date) & (history["currency"] == currency)]
+            st.plotly_chart(history_chart(selected, currency_symbols.get(currency, f"{currency} ")), use_container_width=True)
+
 with tab3:
-    alerts = load_alerts()
-    if alerts.empty:
-        st.info("No alert preferences found.")
+    email = st.session_state["user_email"].strip()
+    phone = st.session_state["user_phone"].strip()
+    if not email and not phone:
+        st.info("Enter your email or phone number in the sidebar to see your alerts.")
     else:
-        for i, row in alerts.iterrows():
-            formatted_date_from = datetime.fromisoformat(row['date_from']).strftime('%b %d, %Y')
-            formatted_date_to = datetime.fromisoformat(row['date_to']).strftime('%b %d, %Y') if row['date_to'] else "N/A"
-            formatted_timestamp = datetime.fromisoformat(row['timestamp']).strftime('%b %d, %Y %I:%M %p')
-            with st.expander(f"{row['origin']} → {row['destination']} | {formatted_date_from} | {row['trip_type']} | {row['target_price']} {currency_symbols.get(row['currency'])} | {row['user_email']}"):
+        col_origin, col_destination, col_size = st.columns([2, 2, 1])
+        origin_filter = col_origin.text_input("Origin (IATA)", max_chars=3, key="alerts_origin", on_change=_first_alert_page).strip().upper()
+        destination_filter = col_destination.text_input("Destination (IATA)", max_chars=3, key="alerts_destination", on_change=_first_alert_page).strip().upper()
+        page_size = col_size.selectbox("Per page", ALERT_PAGE_SIZES, key="alerts_page_size", on_change=_first_alert_page)
+        page = st.session_state.get("alerts_page", 0)
+
+        alerts, total = cached_alert_page(email, phone, page, page_size, origin_filter, destination_filter, alerts_version())
+        pages = max(1, -(-total // page_size))
+        if page >= pages:
+            # Filters or deletions shrank the result: show the last page instead
+            st.session_state["alerts_page"] = page = pages - 1
+            alerts, total = cached_alert_page(email, phone, page, page_size, origin_filter, destination_filter, alerts_version())
+
+        if alerts.empty:
+            st.info("No alert preferences found.")
+        for _, row in alerts.iterrows():
+            alert_id = row['id']
+            with st.expander(f"{row['origin']} → {row['destination']} | {row['date_from_text']} | {row['trip_type']} | {row['target_price']} {currency_symbols.get(row['currency'])} | {row['user_email']}"):
                 col1, col2, col3 = st.columns([2, 1, 1], gap="medium")
-                
+
                 with col1:
                     st.write(f"**Trip:** {row['trip_type']}")
                     st.write(f"**Max Layovers:** {row['max_layovers']}")
-                    st.write(f"**Return Date:** {formatted_date_to}")
-                    st.write(f"**Set On:** {formatted_timestamp}")
+                    st.write(f"**Return Date:** {row['date_to_text']}")
+                    st.write(f"**Set On:** {row['created_text']}")
                     st.write(f"**Preferred Airlines:** {row['preferred_carriers'] if row['preferred_carriers'] else 'Any'}")
 
                 with col2:
-                    new_price = st.number_input("Update Price", min_value=50, value=int(row["target_price"]), key=f"price_{i}")
-                    if st.button("💾 Save", key=f"save_{i}"):
-                        update_alert_price(row['id'], new_price)
-                        st.success("Alert updated.")
+                    new_price = st.number_input("Update Price", min_value=50, value=int(row["target_price"]), key=f"price_{alert_id}")
+                    if st.button("💾 Save", key=f"save_{alert_id}"):
+                        update_alert_price(alert_id, new_price)
+                        if reevaluate_alert(dict(row, target_price=new_price)) is not None:
+                            st.success("Latest price already meets the new target: sending the alert now.")
+                        else:
+                            st.success("Alert updated.")
                         st.rerun()
 
                 with col3:
-                    if st.button("🗑 Delete", key=f"del_{i}"):
-                        delete_alert(row['id'])
+                    if st.button("🗑 Delete", key=f"del_{alert_id}"):
+                        delete_alert(alert_id)
                         st.warning("Alert deleted.")
                         st.rerun()
+
+        if total > page_size:
+            col_prev, col_info, col_next = st.columns([1, 2, 1])
+            if col_prev.button("← Previous", disabled=page == 0, key="alerts_prev"):
+                st.session_state["alerts_page"] = page - 1
+                st.rerun()
+            col_info.caption(f"Showing {page * page_size + 1}–{min((page + 1) * page_size, total)} of {total} alerts")
+            if col_next.button("Next →", disabled=page >= pages - 1, key="alerts_next"):
+                st.session_state["alerts_page"] = page + 1
+                st.rerun()
@@ -0,0 +1,107 @@
+import heapq
+from datetime import datetime, date
+
+import pandas as pd
+
+from fx import CANONICAL_CURRENCY, current_rates
+
+# Relative weight of each signal in an alert group's score
+URGENCY_WEIGHT = 3.0
+VOLATILITY_WEIGHT = 2.0
+GAP_WEIGHT = 2.0
+STALENESS_WEIGHT = 1.0
+# Hours after which a search key counts as fully stale
+STALE_AFTER_HOURS = 24.0
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)[:10]).date()
+
+
+def route_price_stats(daily):
+    """Count, mean and std of the price per (route, travel date) from day rollups.
+
+    std is the spread of the daily average price, i.e. how much the fare of
+    one search has moved over the days observed.
+    """
+    if daily is None or daily.empty:
+        return {}
+    grouped = daily.groupby(["route", "travel_date"])
+    count = grouped["count"].sum()
+    mean = grouped["sum_price"].sum() / count
+    overall = grouped["sum_price"].transform("sum") / grouped["count"].transform("sum")
+    spread = (daily["sum_price"] / daily["count"] - overall) ** 2 * daily["count"]
+    stats = pd.DataFrame({
+        "count": count,
+        "mean": mean,
+        "std": (spread.groupby([daily["route"], daily["travel_date"]]).sum() / count) ** 0.5,
+    })
+    return stats.to_dict(orient="index")
+
+
+def _snapshot_price(snapshot):
+    if not snapshot or snapshot.get("cheapest_price") is None:
+        return None, None
+    return float(snapshot["cheapest_price"]), snapshot.get("currency") or CANONICAL_CURRENCY
+
+
+def _target_price(row, currency):
+    target = float(row["target_price"])
+    try:
+        return current_rates().convert(target, row.get("currency") or CANONICAL_CURRENCY, currency)
+    except KeyError:
+        return target
+
+
+def score_group(key, members, stats, today, now=None, snapshot=None):
+    """Priority of one search key: its `snapshot` (the last search of the key) gives
+    the last seen price and its age, the rollups in `stats` its volatility."""
+    origin, destination, date_from = key[0], key[1], key[2]
+    now = now or datetime.now()
+
+    days_left = max((_parse_date(date_from) - today).days, 0)
+    urgency = 1.0 / (1.0 + days_left / 7.0)
+
+    if not snapshot:
+        # Never searched: no signal yet, so check it as soon as possible
+        return URGENCY_WEIGHT * urgency + VOLATILITY_WEIGHT + GAP_WEIGHT + STALENESS_WEIGHT
+
+    route = stats.get((f"{origin} - {destination}", str(date_from)[:10]))
+    if route and route["count"]:
+        volatility = min(route["std"] / route["mean"], 1.0) if route["mean"] else 0.0
+    else:
+        volatility = 1.0
+
+    # Distance of the closest alert in the group from the last seen price
+    price, currency = _snapshot_price(snapshot)
+    if price is None:
+        closeness = 1.0
+    else:
+        targets = [_target_price(row, currency) for _, row in members]
+        gap = min(max(price - target, 0.0) / max(target, 1.0) for target in targets)
+        closeness = 1.0 / (1.0 + 5.0 * gap)
+
+    try:
+        observed_at = datetime.fromisoformat(str(snapshot["observed_at"]))
+        staleness = min(max((now - observed_at).total_seconds(), 0.0) / 3600.0 / STALE_AFTER_HOURS, 1.0)
+    except (KeyError, TypeError, ValueError):
+        staleness = 1.0
+
+    return (URGENCY_WEIGHT * urgency + VOLATILITY_WEIGHT * volatility
+            + GAP_WEIGHT * closeness + STALENESS_WEIGHT * staleness)
+
+
+def plan_run(groups, stats, budget, today, now=None):
+    """Search keys to check this run, highest score first, capped at `budget` searches.
+
+    `groups` is an iterable of (key, members, snapshot) and is consumed lazily:
+    only the `budget` best keys are held at any time.
+    """
+    # The (negated) position breaks ties so keys themselves are never compared
+    scored = (
+        (score_group(key, members, stats, today, now, snapshot), -i, key)
+        for i, (key, members, snapshot) in enumerate(groups)
+    )
+    return [key for _, _, key in heapq.nlargest(budget, scored)]
@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def bucket_from_env(rate, burst=None, shares=1):
+    # An unset or non-positive rate disables limiting. `shares` processes split
+    # the rate and burst evenly, e.g. the shards of one scheduler run.
+    try:
+        rate = float(rate) if rate else 0.0
+    except ValueError:
+        rate = 0.0
+    if rate <= 0:
+        return None
+    shares = max(1, int(shares))
+    return TokenBucket(rate / shares, max(1.0, float(burst) / shares) if burst else None)
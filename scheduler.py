@@ -1,38 +1,310 @@
-from extractor import extract_flights
-from transformer import transform_flights
-from load import load_alerts,delete_alert
-from notifications import check_alert
+from extractor import extract_flights, cache_stats
+from itinerary import to_records
+from load import backfill_search_buckets,claim_alerts,compact_history,delete_expired_alerts,delete_notified_alerts,flush_writers,iter_alerts,load_flight_records,load_recent_rollups,load_snapshots,mark_alert_channels,mark_alerts_notified,release_alerts,save_snapshots
+from snapshots import alerts_hash, build_snapshot, snapshot_key
+from priority import plan_run, route_price_stats
+from matching import SEARCH_KEY, search_key, match_alerts
+from notifications import NotificationDispatcher, delivered_channels, render_alert, send_alert
+from storage import shard_buckets
+from fx import CANONICAL_CURRENCY, current_rates
+import metrics
 from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import groupby, islice
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
 
-alerts = load_alerts()
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_DIGEST = os.getenv("NOTIFY_DIGEST") == "True"
+# Maximum number of route searches per run over all shards; 0 checks every alert group
+SCHEDULER_REQUEST_BUDGET = int(os.getenv("SCHEDULER_REQUEST_BUDGET", "0"))
+# Days of price history the run priorities are scored on
+PRIORITY_HISTORY_DAYS = int(os.getenv("PRIORITY_HISTORY_DAYS", "30"))
+# Queued notifications are flushed once the outbox reaches this size
+NOTIFY_OUTBOX_LIMIT = int(os.getenv("NOTIFY_OUTBOX_LIMIT", "500"))
+SNAPSHOT_BATCH_SIZE = 100
+# Each of SHARD_COUNT scheduler processes handles the alerts whose search key hashes to its SHARD_INDEX
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+# Identifies this process as the holder of the alert leases it takes
+RUN_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
 
-for index, row in alerts.iterrows():
+# Only the columns the pipeline uses are read from the alerts table
+ALERT_COLUMNS = ["id"] + SEARCH_KEY + [
+    "currency", "max_layovers", "target_price", "preferred_carriers", "user_email", "user_phone", "fingerprint",
+    "notified_channels",
+]
+SCORE_COLUMNS = ["id"] + SEARCH_KEY + ["currency", "target_price"]
+
+
+def iter_alert_groups(today, columns=ALERT_COLUMNS, buckets=None):
+    # Alerts that only differ in their local filters (layovers, carriers, target)
+    # share a single upstream search. The stream is ordered by search key, so
+    # each group is contiguous and only one group is held at a time.
+    rows = enumerate(iter_alerts(columns, today.isoformat(), buckets=buckets))
+    for key, members in groupby(rows, key=lambda item: search_key(item[1])):
+        # An alert read twice would be notified twice
+        seen, unique = set(), []
+        for index, row in members:
+            if row["id"] not in seen:
+                seen.add(row["id"])
+                unique.append((index, row))
+        yield key, unique
+
+
+def with_snapshots(groups, batch_size=SNAPSHOT_BATCH_SIZE):
+    """(key, members, snapshot) for each (key, members) group, where snapshot is the
+    last stored search of the key or None. Snapshots are read `batch_size` groups at a time."""
+    groups = iter(groups)
+    while True:
+        batch = list(islice(groups, batch_size))
+        if not batch:
+            return
+        found = load_snapshots([snapshot_key(key) for key, _ in batch])
+        for key, members in batch:
+            yield key, members, found.get(snapshot_key(key))
+
+
+def bounded_map(executor, fn, items, max_in_flight):
+    """Like executor.map over (key, members, ...) items, yielding (item, future) as they
+    complete, but never pulling more than `max_in_flight` items ahead."""
+    items = iter(items)
+    pending = {}
+    while True:
+        for item in items:
+            pending[executor.submit(fn, *item)] = item
+            if len(pending) >= max_in_flight:
+                break
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+def fetch_group(key, members, previous):
+    # Runs on a worker thread: only upstream calls and parsing happen here.
+    # Every route is searched in the canonical currency whatever the alerts' currencies.
+    origin, destination, date_from, date_to, trip_type = key
     flights, insights, booking_link, generic_link = extract_flights(
-        origin=row['origin'],
-        destination=row['destination'],
-        date_from=row['date_from'],
-        date_to=row['date_to'] if row['date_to'] else None,
-        max_layovers=row['max_layovers'],
-        round_trip=(row['trip_type'] == 'Round-Trip'),
-        currency=row['currency'],
-        preferred_carriers = row.get("preferred_carriers")
+        origin=origin,
+        destination=destination,
+        date_from=date_from,
+        date_to=date_to,
+        max_layovers=max(int(row["max_layovers"]) for _, row in members),
+        round_trip=(trip_type == 'Round-Trip'),
+        currency=CANONICAL_CURRENCY,
+        preferred_carriers=None
     )
 
-    if flights:
-        df = transform_flights(flights,currency=row['currency'])
-        preferred_carriers = row.get('preferred_carriers')
-        if preferred_carriers and "Any" not in preferred_carriers:
-                    df = df[df["airline"].isin(preferred_carriers)]
+    if isinstance(flights, dict) or not flights:
+        return None, booking_link, generic_link
+    # Recorded observations feed the price history and volatility signals of later runs
+    with metrics.timer("transform"):
+        records = to_records(flights)
+    load_flight_records(records, background=True)
+    return flights, booking_link, generic_link
+
+
+def notify_group(members, itineraries, booking_link, generic_link, dispatcher, owner=RUN_ID, rates=None):
+    """Queue the notifications of the group's triggered alerts that this run could claim.
+
+    Returns {alert_id: channels already delivered by an earlier run}. Runs on the
+    main thread so each alert is queued for notification exactly once.
+    """
+    triggered = {}
+    if itineraries is None:
+        for index, row in members:
+            print(f"Failed to retrieve flight data for alert {index}")
+        return triggered
+
+    with metrics.timer("match"):
+        matches = match_alerts(itineraries, [row for _, row in members], rates)
+    # Alerts with different filters can match different itineraries, each with its own booking link
+    links = {}
+    # Only alerts leased to this run are notified; an overlapping run may hold the others
+    claimed = set(claim_alerts([row['id'] for _, row in members if row['id'] in matches], owner))
+    for index, row in members:
+        if row['id'] not in matches:
+            continue
+        if row['id'] not in claimed:
+            print(f"Alert {row['id']} is already being notified by another run")
+            metrics.incr("alerts_claimed_elsewhere")
+            continue
+        match = matches[row['id']]
+        link = booking_link
+        if hasattr(booking_link, "for_token"):
+            token = match['booking_token']
+            if token not in links:
+                links[token] = booking_link.for_token(token)
+            link = links[token]
+        subject, sms_message, html_message = render_alert(match, row['target_price'], link, generic_link)
         email = row['user_email'] if row['user_email'] else None
         phone = row['user_phone'] if row['user_phone'] else None
-        ca = check_alert(df, row['target_price'], row['currency'], booking_link, generic_link, email, phone)
-        if ca:
-            print(f"Alert triggered for row {index}: {row['origin']} → {row['destination']} | {row['date_from']} | {row['trip_type']} | ${row['target_price']}")
-            print(f"Cheapest flight now: {df['price'].min()}")
-            delete_alert(row['id'])
-            print("Alert removed successfully.")
-
-        else:
-            print(f"No alert triggered for row {index}: {row['origin']} → {row['destination']} | {row['date_from']} | {row['trip_type']} | ${row['target_price']}")
-    else:
-        print(f"Failed to retrieve flight data for alert {index}")
+        # A retried alert only goes out on the channels that failed last time
+        sent = delivered_channels(row)
+        send_alert(subject, sms_message, html_message, email, phone, dispatcher=dispatcher, alert_id=row['id'], skip=sent)
+        print(f"Alert triggered for row {index}: {row['origin']} → {row['destination']} | {row['date_from']} | {row['trip_type']} | {row['target_price']} {row['currency']}")
+        print(f"Cheapest qualifying flight now: {match['price']:.2f} {match['currency']}")
+        triggered[row['id']] = sent
+    print(f"No alert triggered for {len(members) - len(triggered)} of {len(members)} alerts on this route")
+    metrics.incr("alerts_triggered", len(triggered))
+    return triggered
+
+
+def settle(dispatcher, claimed, owner=RUN_ID):
+    """Deliver the queued notifications, then record which claimed alerts went out.
+
+    `claimed` maps each alert id to the channels it was already delivered on.
+    Alerts delivered on every channel are marked notified so no run sends them
+    again. The others are released to be retried, with their delivered channels
+    recorded so the retry only sends the failed ones. Returns the number delivered.
+    """
+    with metrics.timer("notify_flush"):
+        outcome = dispatcher.flush()
+    delivered = []
+    retry = []
+    partial = {}
+    for alert_id, sent in claimed.items():
+        channels = outcome.get(alert_id, {})
+        failed = sorted(kind for kind, ok in channels.items() if not ok)
+        if not failed:
+            delivered.append(alert_id)
+            continue
+        print(f"Keeping alert {alert_id}: {', '.join(failed)} notification could not be delivered")
+        retry.append(alert_id)
+        now_sent = sent | {kind for kind, ok in channels.items() if ok}
+        if now_sent != sent:
+            partial[alert_id] = now_sent
+    mark_alerts_notified(delivered, owner)
+    # Channels are recorded while the lease is still held, then the alerts are released
+    mark_alert_channels(partial, owner)
+    release_alerts(retry, owner)
+    return len(delivered)
+
+
+def run(workers=SCHEDULER_WORKERS, budget=SCHEDULER_REQUEST_BUDGET, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT):
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"SHARD_INDEX must be between 0 and {shard_count - 1}, got {shard_index}")
+    buckets = shard_buckets(shard_index, shard_count) if shard_count > 1 else None
+    if buckets is not None:
+        print(f"Running shard {shard_index + 1} of {shard_count} as {RUN_ID}")
+        # Shards run in parallel, each with an even part of the run's budget
+        budget = max(1, budget // shard_count) if budget > 0 else budget
+        if shard_index == 0:
+            # Shards only read their own buckets; alerts saved by an older app have none yet
+            backfilled = backfill_search_buckets()
+            if backfilled:
+                print(f"Assigned search buckets to {backfilled} alerts")
+
+    started = time.perf_counter()
+    today = datetime.now().date()
+    expired = delete_expired_alerts(today, buckets)
+    metrics.incr("alerts_expired", expired)
+    if expired:
+        print(f"Expired {expired} alerts whose departure date has passed.")
+
+    groups = iter_alert_groups(today, buckets=buckets)
+    if budget > 0:
+        # A light first pass scores every group; only the best `budget` keys are kept
+        stats = route_price_stats(load_recent_rollups("day", PRIORITY_HISTORY_DAYS, CANONICAL_CURRENCY))
+        scored = with_snapshots(iter_alert_groups(today, SCORE_COLUMNS, buckets))
+        selected = set(plan_run(scored, stats, budget, today))
+        groups = ((key, members) for key, members in groups if key in selected)
+        print(f"Checking the {len(selected)} highest priority searches")
+
+    # One rate table for the whole run, refreshed here if it has expired
+    rates = current_rates()
+    dispatcher = NotificationDispatcher(workers=NOTIFY_WORKERS, digest=NOTIFY_DIGEST)
+    claimed = {}
+    delivered = 0
+    snapshots = []
+    searches = alerts_seen = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (key, members, previous), future in bounded_map(
+                executor, fetch_group, with_snapshots(groups), max_in_flight=2 * workers):
+            searches += 1
+            alerts_seen += len(members)
+            try:
+                itineraries, booking_link, generic_link = future.result()
+            except Exception as e:
+                print(f"Error while searching flights: {e}")
+                itineraries, booking_link, generic_link = None, None, None
+            if itineraries is None:
+                metrics.incr("search_errors")
+                notify_group(members, itineraries, booking_link, generic_link, dispatcher)
+                continue
+
+            snapshot = build_snapshot(key, itineraries)
+            # Same results for the same alerts and exchange rates as last run: nothing can have changed
+            if (previous and previous["response_hash"] == snapshot["response_hash"]
+                    and previous["alerts_hash"] == alerts_hash(members, rates)):
+                print(f"Unchanged results for {snapshot['search_key']}, skipping {len(members)} alerts")
+                metrics.incr("routes_unchanged")
+                fired = {}
+            else:
+                fired = notify_group(members, itineraries, booking_link, generic_link, dispatcher, rates=rates)
+            claimed.update(fired)
+            snapshot["alerts_hash"] = alerts_hash([(i, row) for i, row in members if row["id"] not in fired], rates)
+            snapshots.append(snapshot)
+
+            if len(snapshots) >= SNAPSHOT_BATCH_SIZE:
+                save_snapshots(snapshots)
+                snapshots = []
+            if len(dispatcher.outbox) >= NOTIFY_OUTBOX_LIMIT:
+                delivered += settle(dispatcher, claimed)
+                claimed = {}
+    save_snapshots(snapshots)
+    print(f"Processed {alerts_seen} alerts in {searches} searches with {workers} workers")
+    metrics.incr("searches", searches)
+    metrics.incr("alerts_checked", alerts_seen)
+
+    delivered += settle(dispatcher, claimed)
+    dispatcher.close()
+    # Notified alerts are only removed after the stream, which keeps the offsets of
+    # the paged alert reads stable. This also clears alerts a crashed run had notified.
+    removed = delete_notified_alerts(buckets)
+    print(f"Notified {delivered} alerts, removed {removed} notified alerts.")
+    metrics.incr("alerts_notified", delivered)
+    metrics.incr("alerts_removed", removed)
+    flush_writers()
+    if shard_index == 0:
+        # Retention is table-wide, so one shard applies it
+        deleted = compact_history()
+        print(f"Compacted price history: {deleted}")
+        for name, value in deleted.items():
+            metrics.incr(f"history_deleted_{name}", value)
+    stats = cache_stats()
+    print(f"SerpAPI cache: {stats}")
+    for name, value in stats.items():
+        metrics.incr(f"serpapi_cache_{name}", value)
+    metrics.observe("run", time.perf_counter() - started)
+    if metrics.METRICS_OUTPUT:
+        metrics.write(metrics.METRICS_OUTPUT)
+        print(f"Wrote run metrics to {metrics.METRICS_OUTPUT}")
+
+
+def run_local_shards(count):
+    """Run `count` shard processes on this machine and wait for all of them."""
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                         env=dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(count)))
+        for index in range(count)
+    ]
+    return max(process.wait() for process in processes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check flight price alerts and send notifications.")
+    parser.add_argument("--local-shards", type=int, default=0,
+                        help="run this many shard processes locally instead of a single run")
+    args = parser.parse_args()
+    if args.local_shards:
+        sys.exit(run_local_shards(args.local_shards))
+    run()
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from extractor import generic_flights_link
+from fx import CANONICAL_CURRENCY
+from itinerary import COLUMNS, Itinerary
+from load import claim_alerts, delete_alert, load_snapshots, mark_alert_channels, mark_alerts_notified, release_alerts
+from matching import match_alerts, search_key
+from notifications import NotificationDispatcher, delivered_channels, render_alert, send_alert
+from storage import alert_fingerprint
+
+# Columns that describe an itinerary; the observation timestamp is excluded
+HASHED_COLUMNS = [c for c in COLUMNS if c != "timestamp"]
+
+
+def snapshot_key(key):
+    return "|".join("" if value is None else str(value) for value in key)
+
+
+def response_hash(itineraries):
+    records = sorted(
+        tuple(str(record[column]) for column in HASHED_COLUMNS)
+        for record in (itinerary.as_record() for itinerary in itineraries)
+    )
+    return hashlib.sha256("\n".join(map("|".join, records)).encode()).hexdigest()
+
+
+def alerts_hash(members, rates=None):
+    fingerprints = sorted(
+        row.get("fingerprint") if isinstance(row.get("fingerprint"), str) else alert_fingerprint(dict(row))
+        for _, row in members
+    )
+    # Alerts priced in another currency can fire on a rate change alone
+    if rates is not None and any(row.get("currency") != CANONICAL_CURRENCY for _, row in members):
+        fingerprints.append(f"rates:{rates.base}:{rates.as_of}")
+    return hashlib.sha256("\n".join(fingerprints).encode()).hexdigest()
+
+
+def build_snapshot(key, itineraries):
+    """Compact record of one search: cheapest fare plus the cheapest itinerary
+    per (airline, layovers), which is enough to re-evaluate any alert filter."""
+    fares = {}
+    for itinerary in sorted(itineraries, key=lambda itinerary: itinerary.price):
+        fares.setdefault((itinerary.airline, itinerary.layovers), itinerary)
+    fares = list(fares.values())
+    cheapest = fares[0] if fares else None
+    return {
+        "search_key": snapshot_key(key),
+        "cheapest_price": cheapest.price if cheapest is not None else None,
+        "airline": cheapest.airline if cheapest is not None else None,
+        "currency": cheapest.currency if cheapest is not None else None,
+        "observed_at": datetime.now().isoformat(timespec="seconds"),
+        "response_hash": response_hash(itineraries),
+        "alerts_hash": None,
+        "fares": json.dumps([itinerary.as_record() for itinerary in fares], default=str),
+    }
+
+
+def snapshot_itineraries(snapshot):
+    return [Itinerary.from_record(record) for record in json.loads(snapshot["fares"] or "[]")]
+
+
+# Alerts fired from the app are sent in the background, off the UI request path
+_sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-sender")
+
+
+def _deliver_alert(row, owner, subject, sms_message, html_message):
+    """Send a claimed alert, then settle its lease like scheduler.settle does."""
+    alert_id = row["id"]
+    sent = delivered_channels(row)
+    dispatcher = NotificationDispatcher(workers=1)
+    try:
+        send_alert(subject, sms_message, html_message, row.get("user_email") or None, row.get("user_phone") or None,
+                   dispatcher=dispatcher, alert_id=alert_id, skip=sent)
+        channels = dispatcher.flush().get(alert_id, {})
+    except Exception as e:
+        print(f"Failed to notify alert {alert_id}: {e}")
+        release_alerts([alert_id], owner)
+        return False
+    finally:
+        dispatcher.close()
+    if not all(channels.values()):
+        # Released for the scheduler to retry the failed channels
+        delivered = sent | {kind for kind, ok in channels.items() if ok}
+        if delivered != sent:
+            mark_alert_channels({alert_id: delivered}, owner)
+        release_alerts([alert_id], owner)
+        return False
+    mark_alerts_notified([alert_id], owner)
+    delete_alert(alert_id)
+    return True
+
+
+def reevaluate_alert(row):
+    """Check an alert against the last snapshot of its route, without calling SerpAPI.
+
+    A triggered alert is claimed and its notification queued; once delivered the
+    alert is removed like the scheduler would. Returns the Future of the delivery
+    (True if it went out), or None if the alert did not fire.
+    """
+    key = search_key(row)
+    origin, destination, date_from, date_to, trip_type = key
+    snapshot = load_snapshots([snapshot_key(key)]).get(snapshot_key(key))
+    if snapshot is None:
+        return None
+    matches = match_alerts(snapshot_itineraries(snapshot), [row])
+    if not matches:
+        return None
+    # A scheduler run may be notifying the same alert right now
+    owner = f"app-{uuid.uuid4().hex[:8]}"
+    if not claim_alerts([row["id"]], owner):
+        return None
+    generic_link = generic_flights_link(origin, destination, date_from, date_to, trip_type == "Round-Trip")
+    subject, sms_message, html_message = render_alert(matches[row["id"]], float(row["target_price"]), None, generic_link)
+    return _sender.submit(_deliver_alert, row, owner, subject, sms_message, html_message)
@@ -0,0 +1,800 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+ALERT_COLUMNS = [
+    "origin", "destination", "date_from", "date_to", "trip_type", "max_layovers",
+    "target_price", "currency", "preferred_carriers", "timestamp", "user_email", "user_phone",
+]
+# Columns that identify a duplicate alert (everything but the creation timestamp)
+ALERT_MATCH_COLUMNS = [c for c in ALERT_COLUMNS if c != "timestamp"]
+
+
+
+def alert_fingerprint(data):
+    """Content hash of the normalized search and notification fields of an alert."""
+    canonical = {}
+    for column in ALERT_MATCH_COLUMNS:
+        value = data.get(column)
+        if column == "preferred_carriers" and value:
+            value = sorted(value.strip("{}").split(",") if isinstance(value, str) else value)
+        elif column == "max_layovers" and value is not None:
+            value = int(value)
+        elif column == "target_price" and value is not None:
+            value = float(value)
+        elif isinstance(value, str):
+            value = value.strip() or None
+        canonical[column] = value
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+# Alerts in any currency share one search per route, so currency is not part of the key
+SEARCH_KEY_COLUMNS = ["origin", "destination", "date_from", "date_to", "trip_type"]
+# Alert pages are read in this order and resume after the last row seen, so
+# alerts added or deleted during a run neither repeat nor shift later pages
+ALERT_PAGE_ORDER = SEARCH_KEY_COLUMNS + ["id"]
+# Alerts are spread over a fixed number of buckets by search key; scheduler
+# shards own disjoint sets of buckets.
+SEARCH_BUCKETS = 256
+
+
+def search_bucket(data):
+    """Stable bucket of an alert's search key, so every alert of a route lands in the same shard."""
+    values = []
+    for column in SEARCH_KEY_COLUMNS:
+        value = data.get(column)
+        values.append("" if value is None or value != value else str(value).strip())
+    digest = hashlib.sha256("|".join(values).encode()).hexdigest()
+    return int(digest[:8], 16) % SEARCH_BUCKETS
+
+
+def shard_buckets(index, count):
+    return [bucket for bucket in range(SEARCH_BUCKETS) if bucket % count == index]
+
+
+SNAPSHOT_COLUMNS = [
+    "search_key", "cheapest_price", "airline", "currency", "observed_at",
+    "response_hash", "alerts_hash", "fares",
+]
+# Hourly and daily price rollups per route and travel date, see history.py
+ROLLUP_KEY = ["route", "travel_date", "currency", "resolution", "bucket_start"]
+ROLLUP_COLUMNS = ROLLUP_KEY + ["count", "min_price", "max_price", "sum_price", "median_price", "sample"]
+# Rollup columns the scheduler's priority scores are computed from
+RECENT_ROLLUP_COLUMNS = ["route", "travel_date", "bucket_start", "count", "sum_price"]
+# flight_prices columns replayed by backtest.py
+OBSERVATION_COLUMNS = ["origin_to_destination", "departure_time", "airline", "layovers", "price", "currency", "timestamp"]
+# Keeps IN (...) filters well below URL and SQLite variable limits
+KEY_CHUNK_SIZE = 100
+
+# Columns added to alerts after the original schema
+ADDED_ALERT_COLUMNS = {
+    "fingerprint": "TEXT", "search_bucket": "INTEGER", "lease_owner": "TEXT",
+    "lease_expires_at": "TEXT", "notified_at": "TEXT", "notified_channels": "TEXT",
+}
+
+FLIGHT_COLUMNS = {
+    "airline": "TEXT", "price": "REAL", "currency": "TEXT", "duration_min": "INTEGER",
+    "layovers": "INTEGER", "layover_info": "TEXT", "origin_to_destination": "TEXT",
+    "departure_time": "TEXT", "arrival_time": "TEXT", "timestamp": "TEXT",
+}
+
+
+class Storage(ABC):
+    """Interface shared by the storage backends used by load.py."""
+
+    @abstractmethod
+    def insert_rows(self, table, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_alerts(self, rows):
+        """Insert alerts, skipping fingerprints that already exist; returns the number inserted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def backfill_fingerprints(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_alerts(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def backfill_search_buckets(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_user_alerts(self, email, phone, offset, limit, origin=None, destination=None):
+        """One page of the alerts saved with `email` or `phone`, by departure date, and the total count."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_alert_page(self, columns, min_date_from, after, limit, buckets=None):
+        """One page of alerts departing on or after `min_date_from`, in ALERT_PAGE_ORDER.
+
+        `after` holds the ALERT_PAGE_ORDER values of the last row of the previous
+        page, or None for the first page. `buckets` restricts the page to the
+        search buckets of one scheduler shard.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_expired_alerts(self, before, buckets=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_alerts(self, ids, owner, now, until):
+        """Lease un-notified alerts to `owner` until `until`, unless another owner holds
+        an unexpired lease. Returns the ids that were claimed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_alerts(self, ids, owner):
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_alerts_notified(self, ids, owner, at):
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_alert_channels(self, channels, owner):
+        """Record the channels each alert was already delivered on, as {id: "email,sms"},
+        for the alerts `owner` holds."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_notified_alerts(self, buckets=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_recent_rollups(self, resolution, since, currency):
+        """RECENT_ROLLUP_COLUMNS of all routes' rollups in `currency` at `resolution`
+        with a bucket starting on or after `since`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_price_observations(self, since=None, routes=None):
+        """OBSERVATION_COLUMNS of flight_prices rows observed on or after the `since` date, optionally for `routes` only."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_snapshots(self, keys):
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_rollups(self, keys):
+        """Stored rollups whose ROLLUP_KEY tuple is in `keys`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_rollups(self, rows):
+        """Add the count and sum of `rows` to the stored rollups with the same key and
+        widen their min and max, in one atomic statement; median and sample are replaced."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_route_rollups(self, route, resolution, since):
+        """Rollups of one route at `resolution` with a bucket starting on or after `since`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_rollups(self, resolution, before):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_flight_prices(self, before):
+        """Delete flight_prices rows observed before the `before` date."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_snapshots(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_alert(self, rowid):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_alert_price(self, rowid, new_price):
+        raise NotImplementedError
+
+
+def _postgrest_value(value):
+    return f'"{value}"' if isinstance(value, str) else str(value)
+
+
+def _postgrest_after(after):
+    # Rows after `after` in ALERT_PAGE_ORDER, as a PostgREST or= filter; Postgres sorts NULLs last
+    terms = []
+    for i, column in enumerate(ALERT_PAGE_ORDER):
+        if after[i] is None:
+            continue  # nothing sorts after NULL
+        conditions = [
+            f"{previous}.is.null" if value is None else f"{previous}.eq.{_postgrest_value(value)}"
+            for previous, value in zip(ALERT_PAGE_ORDER[:i], after[:i])
+        ]
+        conditions.append(f"or({column}.gt.{_postgrest_value(after[i])},{column}.is.null)")
+        terms.append(conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})")
+    return ",".join(terms)
+
+
+class SupabaseStorage(Storage):
+    def __init__(self, client):
+        self.client = client
+
+    def insert_rows(self, table, rows):
+        self.client.table(table).insert(rows).execute()
+
+    def upsert_alerts(self, rows):
+        # ON CONFLICT DO NOTHING: only newly inserted rows come back
+        response = (
+            self.client.table("alerts")
+            .upsert(rows, on_conflict="fingerprint", ignore_duplicates=True)
+            .execute()
+        )
+        return len(response.data or [])
+
+    def backfill_fingerprints(self):
+        rows = self.client.table("alerts").select("id, " + ", ".join(ALERT_MATCH_COLUMNS)).is_("fingerprint", None).execute().data
+        for row in rows:
+            self.client.table("alerts").update({"fingerprint": alert_fingerprint(row)}).eq("id", row["id"]).execute()
+        return len(rows)
+
+    def select_alerts(self):
+        return self.client.table("alerts").select("*").execute().data
+
+    def backfill_search_buckets(self):
+        rows = self.client.table("alerts").select("id, " + ", ".join(SEARCH_KEY_COLUMNS)).is_("search_bucket", None).execute().data
+        for row in rows:
+            self.client.table("alerts").update({"search_bucket": search_bucket(row)}).eq("id", row["id"]).execute()
+        return len(rows)
+
+    def select_user_alerts(self, email, phone, offset, limit, origin=None, destination=None):
+        # Values are quoted so commas or parentheses in them cannot break the or= filter
+        owners = [f'{column}.eq."{value}"' for column, value in (("user_email", email), ("user_phone", phone)) if value]
+        if not owners:
+            return [], 0
+        query = self.client.table("alerts").select("*", count="exact").or_(",".join(owners))
+        if origin:
+            query = query.eq("origin", origin)
+        if destination:
+            query = query.eq("destination", destination)
+        response = query.order("date_from").order("id").range(offset, offset + limit - 1).execute()
+        return response.data, response.count or 0
+
+    def select_alert_page(self, columns, min_date_from, after, limit, buckets=None):
+        query = self.client.table("alerts").select(", ".join(columns)).gte("date_from", min_date_from)
+        if buckets is not None:
+            query = query.in_("search_bucket", buckets)
+        if after is not None:
+            query = query.or_(_postgrest_after(after))
+        for column in ALERT_PAGE_ORDER:
+            query = query.order(column)
+        return query.limit(limit).execute().data
+
+    def delete_expired_alerts(self, before, buckets=None):
+        query = self.client.table("alerts").delete().lt("date_from", before)
+        if buckets is not None:
+            query = query.in_("search_bucket", buckets)
+        return len(query.execute().data or [])
+
+    def claim_alerts(self, ids, owner, now, until):
+        # A single conditional UPDATE: Postgres locks each row, so two runs never both claim it
+        response = (
+            self.client.table("alerts")
+            .update({"lease_owner": owner, "lease_expires_at": until})
+            .in_("id", ids)
+            .is_("notified_at", None)
+            .or_(f"lease_owner.is.null,lease_expires_at.lt.{now},lease_owner.eq.{owner}")
+            .execute()
+        )
+        return [row["id"] for row in response.data or []]
+
+    def release_alerts(self, ids, owner):
+        (self.client.table("alerts").update({"lease_owner": None, "lease_expires_at": None})
+         .in_("id", ids).eq("lease_owner", owner).execute())
+
+    def mark_alerts_notified(self, ids, owner, at):
+        self.client.table("alerts").update({"notified_at": at}).in_("id", ids).eq("lease_owner", owner).execute()
+
+    def mark_alert_channels(self, channels, owner):
+        by_value = {}
+        for alert_id, value in channels.items():
+            by_value.setdefault(value, []).append(alert_id)
+        for value, ids in by_value.items():
+            (self.client.table("alerts").update({"notified_channels": value})
+             .in_("id", ids).eq("lease_owner", owner).execute())
+
+    def delete_notified_alerts(self, buckets=None):
+        query = self.client.table("alerts").delete().not_.is_("notified_at", None)
+        if buckets is not None:
+            query = query.in_("search_bucket", buckets)
+        return len(query.execute().data or [])
+
+    def select_recent_rollups(self, resolution, since, currency):
+        rows = []
+        while True:
+            page = (
+                self.client.table("price_rollups").select(", ".join(RECENT_ROLLUP_COLUMNS))
+                .eq("resolution", resolution).eq("currency", currency).gte("bucket_start", since)
+                .order("route").order("travel_date").order("bucket_start")
+                .range(len(rows), len(rows) + 999)
+                .execute()
+                .data
+            )
+            rows += page
+            if len(page) < 1000:
+                return rows
+
+    def select_price_observations(self, since=None, routes=None):
+        rows = []
+        route_chunks = [routes[i:i + KEY_CHUNK_SIZE] for i in range(0, len(routes), KEY_CHUNK_SIZE)] if routes else [None]
+        for chunk in route_chunks:
+            fetched = 0
+            while True:
+                query = self.client.table("flight_prices").select(", ".join(OBSERVATION_COLUMNS))
+                if since is not None:
+                    query = query.gte("timestamp", since)
+                if chunk is not None:
+                    query = query.in_("origin_to_destination", chunk)
+                # Ordered on every replayed column so pages never overlap
+                for column in OBSERVATION_COLUMNS:
+                    query = query.order(column)
+                page = query.range(fetched, fetched + 999).execute().data
+                rows += page
+                fetched += len(page)
+                if len(page) < 1000:
+                    break
+        return rows
+
+    def select_snapshots(self, keys):
+        rows = []
+        for start in range(0, len(keys), KEY_CHUNK_SIZE):
+            chunk = keys[start:start + KEY_CHUNK_SIZE]
+            rows += self.client.table("route_snapshots").select("*").in_("search_key", chunk).execute().data
+        return rows
+
+    def upsert_snapshots(self, rows):
+        if rows:
+            self.client.table("route_snapshots").upsert(rows, on_conflict="search_key").execute()
+
+    def select_rollups(self, keys):
+        wanted = set(keys)
+        rows = []
+        for start in range(0, len(keys), KEY_CHUNK_SIZE):
+            chunk = keys[start:start + KEY_CHUNK_SIZE]
+            # Filtered per column, then narrowed to the exact keys here
+            query = self.client.table("price_rollups").select("*")
+            for position, column in enumerate(ROLLUP_KEY):
+                query = query.in_(column, sorted({key[position] for key in chunk}))
+            rows += query.execute().data
+        return [row for row in rows if tuple(row[column] for column in ROLLUP_KEY) in wanted]
+
+    def add_rollups(self, rows):
+        # PostgREST upserts can only replace values, see migrations/006_add_price_rollups.sql
+        if rows:
+            self.client.rpc("add_price_rollups", {"rows": rows}).execute()
+
+    def select_route_rollups(self, route, resolution, since):
+        rows = []
+        while True:
+            page = (
+                self.client.table("price_rollups").select("*")
+                .eq("route", route).eq("resolution", resolution).gte("bucket_start", since)
+                .order("bucket_start").order("travel_date")
+                .range(len(rows), len(rows) + 999)
+                .execute()
+                .data
+            )
+            rows += page
+            if len(page) < 1000:
+                return rows
+
+    def delete_rollups(self, resolution, before):
+        query = self.client.table("price_rollups").delete().eq("resolution", resolution).lt("bucket_start", before)
+        return len(query.execute().data or [])
+
+    def delete_flight_prices(self, before):
+        return len(self.client.table("flight_prices").delete().lt("timestamp", before).execute().data or [])
+
+    def delete_alert(self, rowid):
+        self.client.table("alerts").delete().eq("id", rowid).execute()
+
+    def update_alert_price(self, rowid, new_price):
+        # The target price is part of the fingerprint, so it is recomputed with the new price
+        rows = self.client.table("alerts").select(", ".join(ALERT_MATCH_COLUMNS)).eq("id", rowid).execute().data
+        if not rows:
+            return
+        fingerprint = alert_fingerprint(dict(rows[0], target_price=new_price))
+        try:
+            self.client.table("alerts").update({"target_price": new_price, "fingerprint": fingerprint}).eq("id", rowid).execute()
+        except Exception as e:
+            if "23505" not in str(e):
+                raise
+            # An identical alert already exists at the new price
+            self.delete_alert(rowid)
+
+
+def _carriers_to_list(value):
+    # Mirrors how Postgres returns the text[] column that Supabase stores
+    if not value:
+        return None
+    return [c for c in value.strip("{}").split(",") if c]
+
+
+def _sqlite_after(after):
+    # Rows after `after` in ALERT_PAGE_ORDER; SQLite sorts NULLs first
+    terms, params = [], []
+    for i, column in enumerate(ALERT_PAGE_ORDER):
+        conditions = [f"{previous} IS ?" for previous in ALERT_PAGE_ORDER[:i]]
+        params += list(after[:i])
+        if after[i] is None:
+            conditions.append(f"{column} IS NOT NULL")
+        else:
+            conditions.append(f"{column} > ?")
+            params.append(after[i])
+        terms.append("(" + " AND ".join(conditions) + ")")
+    return "(" + " OR ".join(terms) + ")", params
+
+
+def _bucket_filter(where, params, buckets):
+    if buckets is None:
+        return where, params
+    return f"{where} AND search_bucket IN ({', '.join('?' for _ in buckets)})", params + list(buckets)
+
+
+class SQLiteStorage(Storage):
+    """Single-node backend: WAL journal, indexed alerts and price tables, and one
+    transaction per batch of rows."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._migrate()
+
+    def _columns(self, table):
+        return [row["name"] for row in self._conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def _migrate(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+
+            columns = ", ".join(f'"{name}" {kind}' for name, kind in FLIGHT_COLUMNS.items())
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS flight_prices ({columns})")
+            existing = self._columns("flight_prices")
+            for name, kind in FLIGHT_COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f'ALTER TABLE flight_prices ADD COLUMN "{name}" {kind}')
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_flight_prices_route_ts "
+                "ON flight_prices(origin_to_destination, timestamp)"
+            )
+
+            alert_table = (
+                "CREATE TABLE {name} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "origin TEXT, destination TEXT, date_from TEXT, date_to TEXT, trip_type TEXT, "
+                "max_layovers INTEGER, target_price REAL, currency TEXT, preferred_carriers TEXT, "
+                "timestamp TEXT, user_email TEXT, user_phone TEXT, fingerprint TEXT, "
+                "search_bucket INTEGER, lease_owner TEXT, lease_expires_at TEXT, notified_at TEXT, notified_channels TEXT)"
+            )
+            existing = self._columns("alerts")
+            if not existing:
+                self._conn.execute(alert_table.format(name="alerts"))
+            elif "id" not in existing:
+                # Legacy table without an id column: rebuild it keeping the rows
+                self._conn.execute(alert_table.format(name="alerts_new"))
+                copied = [c for c in ALERT_COLUMNS if c in existing and c != "currency"]
+                select = ", ".join(copied)
+                currency = "COALESCE(currency, 'USD')" if "currency" in existing else "'USD'"
+                self._conn.execute(
+                    f"INSERT INTO alerts_new ({select}, currency) SELECT {select}, {currency} FROM alerts"
+                )
+                self._conn.execute("DROP TABLE alerts")
+                self._conn.execute("ALTER TABLE alerts_new RENAME TO alerts")
+            existing = self._columns("alerts")
+            for name, kind in ADDED_ALERT_COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE alerts ADD COLUMN {name} {kind}")
+            self._backfill_fingerprints()
+            self._backfill_search_buckets()
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_alerts_search_key "
+                "ON alerts(origin, destination, date_from, date_to, trip_type, currency)"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_fingerprint ON alerts(fingerprint)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_search_bucket ON alerts(search_bucket)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_user_email ON alerts(user_email, date_from)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_user_phone ON alerts(user_phone, date_from)")
+
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS route_snapshots ("
+                "search_key TEXT PRIMARY KEY, cheapest_price REAL, airline TEXT, currency TEXT, "
+                "observed_at TEXT, response_hash TEXT, alerts_hash TEXT, fares TEXT)"
+            )
+
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS price_rollups ("
+                "route TEXT, travel_date TEXT, currency TEXT, resolution TEXT, bucket_start TEXT, "
+                "count INTEGER, min_price REAL, max_price REAL, sum_price REAL, median_price REAL, sample TEXT, "
+                f"PRIMARY KEY ({', '.join(ROLLUP_KEY)}))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_price_rollups_retention ON price_rollups(resolution, bucket_start)"
+            )
+
+    def _backfill_fingerprints(self):
+        seen = set()
+        rows = self._conn.execute("SELECT * FROM alerts WHERE fingerprint IS NULL ORDER BY id").fetchall()
+        for row in rows:
+            fingerprint = alert_fingerprint(dict(row))
+            taken = fingerprint in seen or self._conn.execute(
+                "SELECT 1 FROM alerts WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if taken:
+                # Older duplicates cannot coexist with the unique index
+                self._conn.execute("DELETE FROM alerts WHERE id = ?", (row["id"],))
+            else:
+                seen.add(fingerprint)
+                self._conn.execute("UPDATE alerts SET fingerprint = ? WHERE id = ?", (fingerprint, row["id"]))
+
+    def _backfill_search_buckets(self):
+        rows = self._conn.execute(
+            f"SELECT id, {', '.join(SEARCH_KEY_COLUMNS)} FROM alerts WHERE search_bucket IS NULL"
+        ).fetchall()
+        self._conn.executemany(
+            "UPDATE alerts SET search_bucket = ? WHERE id = ?",
+            [(search_bucket(dict(row)), row["id"]) for row in rows],
+        )
+        return len(rows)
+
+    def insert_rows(self, table, rows):
+        if not rows:
+            return
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        placeholders = ", ".join("?" for _ in columns)
+        names = ", ".join(f'"{c}"' for c in columns)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})',
+                [tuple(row.get(c) for c in columns) for row in rows],
+            )
+
+    def upsert_alerts(self, rows):
+        columns = ALERT_COLUMNS + ["fingerprint", "search_bucket"]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT INTO alerts ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                "ON CONFLICT(fingerprint) DO NOTHING",
+                [[row.get(column) for column in columns] for row in rows],
+            )
+            return self._conn.total_changes - before
+
+    def backfill_fingerprints(self):
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._backfill_fingerprints()
+            return self._conn.total_changes - before
+
+    def backfill_search_buckets(self):
+        with self._lock, self._conn:
+            return self._backfill_search_buckets()
+
+    def select_alerts(self):
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute("SELECT * FROM alerts ORDER BY id")]
+        for row in rows:
+            row["preferred_carriers"] = _carriers_to_list(row["preferred_carriers"])
+        return rows
+
+    def select_user_alerts(self, email, phone, offset, limit, origin=None, destination=None):
+        owners = [(f"{column} = ?", value) for column, value in (("user_email", email), ("user_phone", phone)) if value]
+        if not owners:
+            return [], 0
+        where = "(" + " OR ".join(clause for clause, _ in owners) + ")"
+        params = [value for _, value in owners]
+        for column, value in (("origin", origin), ("destination", destination)):
+            if value:
+                where += f" AND {column} = ?"
+                params.append(value)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM alerts WHERE {where}", params).fetchone()[0]
+            rows = [dict(row) for row in self._conn.execute(
+                f"SELECT * FROM alerts WHERE {where} ORDER BY date_from, id LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            )]
+        for row in rows:
+            row["preferred_carriers"] = _carriers_to_list(row["preferred_carriers"])
+        return rows, total
+
+    def select_alert_page(self, columns, min_date_from, after, limit, buckets=None):
+        where, params = _bucket_filter("date_from >= ?", [min_date_from], buckets)
+        if after is not None:
+            condition, after_params = _sqlite_after(after)
+            where, params = f"{where} AND {condition}", params + after_params
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM alerts WHERE {where} ORDER BY {', '.join(ALERT_PAGE_ORDER)} LIMIT ?",
+                params + [limit],
+            )]
+        for row in rows:
+            if "preferred_carriers" in row:
+                row["preferred_carriers"] = _carriers_to_list(row["preferred_carriers"])
+        return rows
+
+    def delete_expired_alerts(self, before, buckets=None):
+        where, params = _bucket_filter("date_from < ?", [before], buckets)
+        with self._lock, self._conn:
+            return self._conn.execute(f"DELETE FROM alerts WHERE {where}", params).rowcount
+
+    def claim_alerts(self, ids, owner, now, until):
+        # SQLite serializes writers, so the conditional UPDATE is atomic across processes
+        ids = [int(i) for i in ids]
+        marks = ", ".join("?" for _ in ids)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE alerts SET lease_owner = ?, lease_expires_at = ? "
+                f"WHERE id IN ({marks}) AND notified_at IS NULL "
+                f"AND (lease_owner IS NULL OR lease_expires_at < ? OR lease_owner = ?)",
+                [owner, until] + ids + [now, owner],
+            )
+            rows = self._conn.execute(
+                f"SELECT id FROM alerts WHERE id IN ({marks}) AND lease_owner = ? AND notified_at IS NULL",
+                ids + [owner],
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def release_alerts(self, ids, owner):
+        ids = [int(i) for i in ids]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE alerts SET lease_owner = NULL, lease_expires_at = NULL "
+                f"WHERE id IN ({', '.join('?' for _ in ids)}) AND lease_owner = ?",
+                ids + [owner],
+            )
+
+    def mark_alerts_notified(self, ids, owner, at):
+        ids = [int(i) for i in ids]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE alerts SET notified_at = ? WHERE id IN ({', '.join('?' for _ in ids)}) AND lease_owner = ?",
+                [at] + ids + [owner],
+            )
+
+    def mark_alert_channels(self, channels, owner):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE alerts SET notified_channels = ? WHERE id = ? AND lease_owner = ?",
+                [(value, int(alert_id), owner) for alert_id, value in channels.items()],
+            )
+
+    def delete_notified_alerts(self, buckets=None):
+        where, params = _bucket_filter("notified_at IS NOT NULL", [], buckets)
+        with self._lock, self._conn:
+            return self._conn.execute(f"DELETE FROM alerts WHERE {where}", params).rowcount
+
+    def select_recent_rollups(self, resolution, since, currency):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                f"SELECT {', '.join(RECENT_ROLLUP_COLUMNS)} FROM price_rollups "
+                "WHERE resolution = ? AND bucket_start >= ? AND currency = ?",
+                (resolution, since, currency),
+            )]
+
+    def select_price_observations(self, since=None, routes=None):
+        where, params = ["1 = 1"], []
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        route_chunks = [routes[i:i + KEY_CHUNK_SIZE] for i in range(0, len(routes), KEY_CHUNK_SIZE)] if routes else [None]
+        columns = ", ".join(OBSERVATION_COLUMNS)
+        rows = []
+        with self._lock:
+            for chunk in route_chunks:
+                clause, values = list(where), list(params)
+                if chunk is not None:
+                    clause.append(f"origin_to_destination IN ({', '.join('?' for _ in chunk)})")
+                    values += chunk
+                rows += [dict(row) for row in self._conn.execute(
+                    f"SELECT {columns} FROM flight_prices WHERE {' AND '.join(clause)}", values,
+                )]
+        return rows
+
+    def select_snapshots(self, keys):
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), KEY_CHUNK_SIZE):
+                chunk = keys[start:start + KEY_CHUNK_SIZE]
+                rows += [dict(row) for row in self._conn.execute(
+                    f"SELECT * FROM route_snapshots WHERE search_key IN ({', '.join('?' for _ in chunk)})",
+                    chunk,
+                )]
+        return rows
+
+    def upsert_snapshots(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO route_snapshots ({', '.join(SNAPSHOT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in SNAPSHOT_COLUMNS)})",
+                [[row.get(column) for column in SNAPSHOT_COLUMNS] for row in rows],
+            )
+
+    def select_rollups(self, keys):
+        rows = []
+        key_list = ", ".join(ROLLUP_KEY)
+        with self._lock:
+            for start in range(0, len(keys), KEY_CHUNK_SIZE):
+                chunk = keys[start:start + KEY_CHUNK_SIZE]
+                values = ", ".join(f"({', '.join('?' for _ in ROLLUP_KEY)})" for _ in chunk)
+                rows += [dict(row) for row in self._conn.execute(
+                    f"SELECT * FROM price_rollups WHERE ({key_list}) IN (VALUES {values})",
+                    [value for key in chunk for value in key],
+                )]
+        return rows
+
+    def add_rollups(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO price_rollups ({', '.join(ROLLUP_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in ROLLUP_COLUMNS)}) "
+                f"ON CONFLICT ({', '.join(ROLLUP_KEY)}) DO UPDATE SET "
+                "count = price_rollups.count + excluded.count, "
+                "min_price = min(price_rollups.min_price, excluded.min_price), "
+                "max_price = max(price_rollups.max_price, excluded.max_price), "
+                "sum_price = price_rollups.sum_price + excluded.sum_price, "
+                "median_price = excluded.median_price, sample = excluded.sample",
+                [[row.get(column) for column in ROLLUP_COLUMNS] for row in rows],
+            )
+
+    def select_route_rollups(self, route, resolution, since):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT * FROM price_rollups WHERE route = ? AND resolution = ? AND bucket_start >= ? "
+                "ORDER BY bucket_start, travel_date",
+                (route, resolution, since),
+            )]
+
+    def delete_rollups(self, resolution, before):
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM price_rollups WHERE resolution = ? AND bucket_start < ?", (resolution, before)
+            ).rowcount
+
+    def delete_flight_prices(self, before):
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM flight_prices WHERE timestamp < ?", (before,)).rowcount
+
+    def delete_alert(self, rowid):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM alerts WHERE id = ?", (int(rowid),))
+
+    def update_alert_price(self, rowid, new_price):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM alerts WHERE id = ?", (int(rowid),)).fetchone()
+            if row is None:
+                return
+            fingerprint = alert_fingerprint(dict(row, target_price=float(new_price)))
+            try:
+                self._conn.execute(
+                    "UPDATE alerts SET target_price = ?, fingerprint = ? WHERE id = ?",
+                    (float(new_price), fingerprint, int(rowid)),
+                )
+            except sqlite3.IntegrityError:
+                # An identical alert already exists at the new price
+                self._conn.execute("DELETE FROM alerts WHERE id = ?", (int(rowid),))
+
+
+def storage_from_env(supabase_credentials):
+    # Credentials are looked up lazily so the SQLite backend needs no Supabase secrets
+    backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("SQLITE_PATH", "flight_prices_streamlit.db"))
+    from supabase import create_client
+    return SupabaseStorage(create_client(*supabase_credentials()))
@@ -0,0 +1,101 @@
+"""Two scheduler runs sharing one alerts table must never notify an alert twice.
+
+Each owner gets its own SQLiteStorage connection to the same file, as two
+scheduler processes would.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import _normalize_alert
+from storage import SQLiteStorage
+
+NOW = "2026-10-18T12:00:00Z"
+UNTIL = "2026-10-18T12:15:00Z"
+LATER = "2026-10-18T12:30:00Z"
+
+
+def alert(i):
+    return _normalize_alert(dict(
+        origin="SEA", destination="SJC", date_from="2026-12-10", date_to=None, trip_type="One-Way",
+        currency="USD", max_layovers=1, target_price=100 + i, preferred_carriers=None,
+        user_email=f"user{i}@example.com", user_phone="+15550000000", timestamp="2026-10-18 12:00:00 PM",
+    ))
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / "alerts.db")
+    first = SQLiteStorage(path)
+    first.upsert_alerts([alert(i) for i in range(20)])
+    second = SQLiteStorage(path)
+    ids = [row["id"] for row in first.select_alerts()]
+    return first, second, ids
+
+
+def test_only_one_owner_claims_an_alert(stores):
+    first, second, ids = stores
+    assert sorted(first.claim_alerts(ids, "a", NOW, UNTIL)) == sorted(ids)
+    assert second.claim_alerts(ids, "b", NOW, UNTIL) == []
+    # Renewing its own lease is allowed
+    assert sorted(first.claim_alerts(ids, "a", NOW, UNTIL)) == sorted(ids)
+
+
+def test_expired_lease_is_taken_over(stores):
+    first, second, ids = stores
+    first.claim_alerts(ids[:5], "a", NOW, UNTIL)
+    assert sorted(second.claim_alerts(ids[:5], "b", LATER, "2026-10-18T12:45:00Z")) == sorted(ids[:5])
+    # The first owner lost its lease and can no longer mark the alerts
+    first.mark_alerts_notified(ids[:5], "a", LATER)
+    assert second.claim_alerts(ids[:5], "b", LATER, "2026-10-18T12:45:00Z") != []
+
+
+def test_released_alert_is_claimed_again(stores):
+    first, second, ids = stores
+    first.claim_alerts(ids[:3], "a", NOW, UNTIL)
+    first.release_alerts(ids[:3], "a")
+    assert sorted(second.claim_alerts(ids[:3], "b", NOW, UNTIL)) == sorted(ids[:3])
+
+
+def test_notified_alert_is_never_claimed_again_and_is_deleted(stores):
+    first, second, ids = stores
+    first.claim_alerts(ids[:4], "a", NOW, UNTIL)
+    first.mark_alerts_notified(ids[:4], "a", NOW)
+    # Not even once the lease has expired
+    assert second.claim_alerts(ids[:4], "b", LATER, "2026-10-18T12:45:00Z") == []
+    assert second.delete_notified_alerts() == 4
+    assert {row["id"] for row in first.select_alerts()} == set(ids[4:])
+
+
+def test_concurrent_claims_are_disjoint(stores):
+    first, second, ids = stores
+    claimed = {"a": [], "b": []}
+
+    def claim(store, owner):
+        for alert_id in ids:
+            claimed[owner] += store.claim_alerts([alert_id], owner, NOW, UNTIL)
+
+    threads = [threading.Thread(target=claim, args=(first, "a")), threading.Thread(target=claim, args=(second, "b"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not set(claimed["a"]) & set(claimed["b"])
+    assert sorted(claimed["a"] + claimed["b"]) == sorted(ids)
+
+
+def test_delivered_channels_are_kept_for_the_retry(stores):
+    first, second, ids = stores
+    first.claim_alerts(ids[:2], "a", NOW, UNTIL)
+    # Only the lease holder records channels
+    second.mark_alert_channels({ids[0]: "sms"}, "b")
+    first.mark_alert_channels({ids[0]: "email", ids[1]: "email,sms"}, "a")
+    first.release_alerts(ids[:2], "a")
+    channels = {row["id"]: row["notified_channels"] for row in second.select_alerts()}
+    assert channels[ids[0]] == "email"
+    assert channels[ids[1]] == "email,sms"
+    assert sorted(second.claim_alerts(ids[:2], "b", NOW, UNTIL)) == sorted(ids[:2])
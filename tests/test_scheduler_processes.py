@@ -0,0 +1,112 @@
+"""Two scheduler processes checking the same alerts notify each triggered alert once.
+
+Both runs search through the local SerpAPI stand-in and email a local SMTP
+sink; the alert leases in the shared SQLite file decide which run sends what.
+"""
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from load import _normalize_alert
+from serpapi_standin import start_standin
+from storage import SQLiteStorage
+
+ROUTES = 20
+ALERTS_PER_ROUTE = 5
+
+
+class RecipientSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.sendmail; records the recipient of every message."""
+
+    def handle(self):
+        self.wfile.write(b"220 sink\r\n")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"RCPT":
+                recipients.append(line.decode().split(":", 1)[1].strip().strip("<>"))
+                self.wfile.write(b"250 ok\r\n")
+            elif verb == b"DATA":
+                self.wfile.write(b"354 end with .\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.recipients += recipients
+                recipients = []
+                self.wfile.write(b"250 queued\r\n")
+            elif verb == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+@pytest.fixture
+def smtp():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RecipientSink)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.recipients = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def standin():
+    # Some latency keeps the two runs' searches overlapping
+    server = start_standin(latency=0.02)
+    yield server
+    server.shutdown()
+
+
+def alert(i):
+    route = i % ROUTES
+    return _normalize_alert(dict(
+        origin="SEA", destination=f"Z{chr(ord('A') + route)}A", date_from="2026-12-10", date_to=None,
+        trip_type="One-Way", currency="USD", max_layovers=2, preferred_carriers=None,
+        # Above every recorded fare for even alerts, below every fare for odd ones
+        target_price=100000.0 if i % 2 == 0 else 1.0,
+        user_email=f"user{i}@example.com", user_phone="", timestamp="2026-10-18 12:00:00 PM",
+    ))
+
+
+def test_triggered_alerts_are_notified_exactly_once(tmp_path, smtp, standin):
+    path = str(tmp_path / "alerts.db")
+    alerts = [alert(i) for i in range(ROUTES * ALERTS_PER_ROUTE)]
+    SQLiteStorage(path).upsert_alerts(alerts)
+    env = dict(
+        os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=path, SHARD_COUNT="1",
+        SERPAPI_KEY="standin", SERPAPI_BASE_URL=standin.base_url, SERPAPI_CACHE_TTL="0", SERPAPI_RATE_PER_SEC="0",
+        SET_EMAIL_ALERT="True", SET_SMS_ALERT="False", EMAIL_SENDER="test@example.com", EMAIL_APP_PASSWORD="",
+        SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp.server_address[1]), SMTP_STARTTLS="False",
+        FX_CACHE_PATH=str(tmp_path / "fx_rates_cache.json"),
+    )
+    runs = [
+        subprocess.Popen([sys.executable, os.path.join(ROOT, "scheduler.py")], cwd=str(tmp_path), env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        for _ in range(2)
+    ]
+    for run in runs:
+        _, stderr = run.communicate(timeout=120)
+        assert run.returncode == 0, stderr.decode()
+
+    triggered = {row["user_email"] for row in alerts if row["target_price"] > 1}
+    sent = Counter(smtp.recipients)
+    assert set(sent) == triggered
+    assert all(count == 1 for count in sent.values())
+    # Notified alerts are removed, the others stay for the next run
+    remaining = {row["user_email"] for row in SQLiteStorage(path).select_alerts()}
+    assert remaining == {row["user_email"] for row in alerts} - triggered
@@ -0,0 +1,161 @@
+"""HTTP client for the SerpAPI search endpoint.
+
+Every thread keeps one requests.Session, so searches reuse kept-alive
+connections. Connection errors, timeouts, 429 and 5xx responses are retried
+with jittered exponential backoff, honoring Retry-After. After
+SERPAPI_BREAKER_THRESHOLD searches in a row have failed, the circuit breaker
+fails searches immediately for SERPAPI_BREAKER_COOLDOWN seconds instead of
+letting every worker wait out its retries.
+
+SERPAPI_BASE_URL points the client at another host, such as the local
+stand-in in benchmarks/serpapi_standin.py.
+"""
+import os
+import random
+import threading
+import time
+
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """A search that failed after its retries, or was refused by an open circuit."""
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; once `cooldown` seconds have
+    passed a single trial call is let through, and its outcome closes or reopens it."""
+
+    def __init__(self, threshold=5, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self._opened_at is None and self.failures >= self.threshold):
+                if self._opened_at is None:
+                    metrics.incr("serpapi_circuit_opened")
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+def _retry_after(response):
+    # Only the delay-seconds form; SerpAPI does not send HTTP dates
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class SerpApiClient:
+    def __init__(self, base_url="https://serpapi.com", timeout=30.0, retries=3, backoff=0.5, max_backoff=30.0,
+                 breaker=None, rate_limiter=None):
+        self.url = base_url.rstrip("/") + "/search"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            # Imported on first search so module import stays cheap
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _attempt(self, params):
+        """(payload, None) on an answer, (None, (error, Retry-After)) on a retryable failure."""
+        import requests
+        if self.rate_limiter is not None:
+            with metrics.timer("serpapi_rate_limit_wait"):
+                self.rate_limiter.acquire()
+        try:
+            with metrics.timer("serpapi_request"):
+                response = self._session().get(self.url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            return None, (e, None)
+        if response.status_code in RETRY_STATUSES:
+            return None, (UpstreamError(f"SerpAPI returned HTTP {response.status_code}"), _retry_after(response))
+        try:
+            return response.json(), None
+        except ValueError as e:
+            # A truncated body is as transient as a dropped connection
+            return None, (e, None)
+
+    def search(self, params):
+        """SerpAPI's JSON answer for `params`, including error answers such as an
+        invalid key; raises UpstreamError when no answer could be obtained."""
+        if self.breaker is not None and not self.breaker.allow():
+            metrics.incr("serpapi_circuit_rejected")
+            raise CircuitOpenError("SerpAPI circuit is open after repeated failures")
+        params = dict(params, output="json", source="python")
+        for attempt in range(self.retries + 1):
+            payload, failure = self._attempt(params)
+            if payload is not None:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return payload
+            error, retry_after = failure
+            delay = self._delay(attempt, retry_after)
+            if attempt == self.retries or delay > self.max_backoff:
+                break
+            metrics.incr("serpapi_retries")
+            time.sleep(delay)
+        metrics.incr("serpapi_failures")
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        raise UpstreamError(f"SerpAPI search failed after {attempt + 1} attempts: {error}") from error
+
+
+def client_from_env(rate_limiter=None):
+    threshold = int(os.getenv("SERPAPI_BREAKER_THRESHOLD", "5"))
+    return SerpApiClient(
+        base_url=os.getenv("SERPAPI_BASE_URL", "https://serpapi.com"),
+        timeout=float(os.getenv("SERPAPI_TIMEOUT", "30")),
+        retries=int(os.getenv("SERPAPI_RETRIES", "3")),
+        backoff=float(os.getenv("SERPAPI_BACKOFF", "0.5")),
+        max_backoff=float(os.getenv("SERPAPI_MAX_BACKOFF", "30")),
+        # A non-positive threshold disables the breaker
+        breaker=CircuitBreaker(threshold, float(os.getenv("SERPAPI_BREAKER_COOLDOWN", "60"))) if threshold > 0 else None,
+        rate_limiter=rate_limiter,
+    )